@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import numpy as np
+
+
+class BatchEntityScorer(object):
+    """
+    It scores at once all the entities of the schedule tweets in the time
+    window of a UG tweet. The tokens to be matched of the entities are
+    mapped CSR-style (concatenated token IDs, with the entity of each
+    token) and whether each window-unique token matches the tweet is
+    computed once. The entity scores are then counted with NumPy, and
+    compared with the thresholds of their types as vectorized masks.
+
+    The arrays of each schedule tweet are kept for the next windows, up
+    to max_size schedule tweets, or until the schedule tweet is discarded
+    when it leaves the time window.
+    """
+    def __init__(self, max_size):
+        """
+        """
+        self.max_size = max_size
+        self.arrays = {}
+
+    def entity_arrays(self, sch_tweet_id, sch_entities):
+        """
+        Return the arrays of the entities of a schedule tweet: the IDs of
+        the tokens to be matched, the entity of each token, the number of
+        tokens and the type ID of each entity
+        """
+        arrays = self.arrays.get(sch_tweet_id)
+        if arrays is not None:
+            return arrays
+
+        token_ids = []
+        owners = []
+        for n, sch_entity in enumerate(sch_entities):
+            for token_id, to_match in zip(sch_entity.tokens, sch_entity.mask):
+                if to_match:
+                    token_ids.append(token_id)
+                    owners.append(n)
+
+        arrays = (np.array(token_ids, dtype=np.int32),
+                  np.array(owners, dtype=np.int32),
+                  np.array([x.size for x in sch_entities], dtype=np.float64),
+                  np.array([x.etype_id for x in sch_entities], dtype=np.int8))
+
+        if len(self.arrays) >= self.max_size:
+            self.arrays.clear()
+        self.arrays[sch_tweet_id] = arrays
+        return arrays
+
+    def discard(self, sch_tweet_id):
+        """
+        Remove the arrays of a schedule tweet, if kept
+        """
+        self.arrays.pop(sch_tweet_id, None)
+
+    def score(self, DictSched, sch_tweet_ids, tweet_tokens_index, thresholds):
+        """
+        Score the entities of the schedule tweets against the UG tweet,
+        whose tokens are given in a FuzzyTokenIndex. thresholds is the
+        string similarity threshold of each entity type ID. It returns the
+        list of (schedule tweet ID, entity), with the array of their
+        scores and the mask of the entities over the threshold.
+        """
+        entities = []
+        parts = []
+        for sch_tweet_id in sch_tweet_ids:
+            sch_entities = DictSched[sch_tweet_id].entities
+            parts.append(self.entity_arrays(sch_tweet_id, sch_entities))
+            entities.extend((sch_tweet_id, x) for x in sch_entities)
+
+        if not entities:
+            return entities, np.zeros(0), np.zeros(0, dtype=bool)
+
+        # Entity of each token in the whole window
+        offsets = np.cumsum([0] + [len(x[2]) for x in parts[:-1]])
+        token_ids = np.concatenate([x[0] for x in parts])
+        owners = np.concatenate([x[1] + offset
+                                 for x, offset in zip(parts, offsets)])
+        sizes = np.concatenate([x[2] for x in parts])
+        etype_ids = np.concatenate([x[3] for x in parts])
+
+        # Each window-unique token is matched against the tweet once
+        unique_ids, inverse = np.unique(token_ids, return_inverse=True)
+        token_matched = np.fromiter(
+            (tweet_tokens_index.has_match(x) for x in unique_ids.tolist()),
+            dtype=bool, count=len(unique_ids))
+
+        scores = np.bincount(owners, weights=token_matched[inverse],
+                             minlength=len(entities)) / sizes
+        matched = scores >= np.asarray(thresholds)[etype_ids]
+
+        return entities, scores, matched
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import re
+import sys
+import argparse
+import logging
+import subprocess
+
+from conll_eval import ConllEval
+from utils import set_log_config
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'fixtures')
+CONLLEVAL = os.path.join(os.path.dirname(FIXTURES_DIR), os.pardir,
+                         'conlleval')
+# Fixture files in CoNLL format, with the raw option they are evaluated
+FIXTURES = [('conll_results.txt', False),
+            ('conll_results_raw.txt', True)]
+
+COUNTS_RE = re.compile(r'processed (\d+) tokens with (\d+) phrases; '
+                       r'found: (\d+) phrases; correct: (\d+)\.')
+OVERALL_RE = re.compile(r'accuracy: +[\d.]+%; precision: +([\d.]+)%; '
+                        r'recall: +([\d.]+)%; FB1: +([\d.]+)')
+TYPE_RE = re.compile(r' *(.*): precision: +([\d.]+)%; '
+                     r'recall: +([\d.]+)%; FB1: +([\d.]+) +(\d+)')
+
+
+def parse_report(report):
+    """
+    Return the counts, the overall scores and a Dict with the scores of
+    each chunk type read from a report of conlleval, as strings
+    """
+    counts = overall = None
+    by_type = {}
+    for line in report.splitlines():
+        if COUNTS_RE.match(line):
+            counts = COUNTS_RE.match(line).groups()
+        elif OVERALL_RE.match(line):
+            overall = OVERALL_RE.match(line).groups()
+        elif TYPE_RE.match(line):
+            match = TYPE_RE.match(line)
+            by_type[match.group(1)] = match.groups()[1:]
+
+    return counts, overall, by_type
+
+
+class CheckConllEval(object):
+    """
+    It validates conll_eval.py against the conlleval script: both
+    evaluate the same files in CoNLL format (by default the fixtures in
+    benchmark/fixtures), and the counts of tokens and chunks, the overall
+    precision, recall and FB1, and those of each chunk type are compared,
+    as printed by conlleval. The differences are logged, and the exit
+    status is 1 if any.
+
+    Usage:
+    python -m benchmark.check_conll_eval
+    [-i ../path/to/RESULTS.txt (default are the fixtures)]
+    [-r (raw tags, for the input file)]
+
+    """
+    def __init__(self, files=None):
+        """
+        """
+        self.files = files or [(os.path.join(FIXTURES_DIR, name), raw)
+                               for name, raw in FIXTURES]
+
+    def run_conlleval(self, path, raw):
+        """
+        Return the report of the conlleval script on a file
+        """
+        cmd = ['perl', CONLLEVAL] + (['-r'] if raw else [])
+        with open(path) as inf:
+            return subprocess.check_output(cmd, stdin=inf)
+
+    def run_conll_eval(self, path, raw):
+        """
+        Return the counts, the overall scores and the scores of each chunk
+        type computed by ConllEval on a file, formatted as by conlleval
+        """
+        conll_eval = ConllEval(raw=raw)
+        with open(path) as inf:
+            conll_eval.add_file(inf)
+        conll_eval.finish()
+
+        counts = tuple(str(x) for x in (
+            conll_eval.token_counter, conll_eval.found_correct,
+            conll_eval.found_guessed, conll_eval.correct_chunk))
+        overall = tuple('%.2f' % x for x in conll_eval.overall())
+        by_type = dict((etype, tuple('%.2f' % x for x in scores[:3]) +
+                        (str(scores[3]),))
+                       for etype, scores in conll_eval.by_type().iteritems())
+
+        return counts, overall, by_type
+
+    def compare(self, path, raw):
+        """
+        Compare the evaluations of a file, returning the number of
+        differences
+        """
+        perl_counts, perl_overall, perl_by_type = parse_report(
+            self.run_conlleval(path, raw))
+        counts, overall, by_type = self.run_conll_eval(path, raw)
+
+        diffs = []
+        if counts != perl_counts:
+            diffs.append(('counts', perl_counts, counts))
+        if overall != perl_overall:
+            diffs.append(('overall', perl_overall, overall))
+        for etype in sorted(set(perl_by_type) | set(by_type)):
+            if by_type.get(etype) != perl_by_type.get(etype):
+                diffs.append((etype, perl_by_type.get(etype),
+                              by_type.get(etype)))
+
+        for name, expected, found in diffs:
+            logging.error("%s, %s: conlleval %s, conll_eval.py %s",
+                          os.path.basename(path), name, expected, found)
+        logging.info("%s: %d chunk types, %d differences",
+                     os.path.basename(path), len(perl_by_type), len(diffs))
+
+        return len(diffs)
+
+    def run(self):
+        """
+        Compare the evaluations of all the files, returning the number of
+        differences
+        """
+        logging.info("Comparing conll_eval.py with conlleval...")
+        diffs = sum(self.compare(path, raw) for path, raw in self.files)
+        logging.info("Done!")
+
+        return diffs
+
+
+def arg_parser():
+    """
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", type=str, dest='input_file',
+                        help="Input file in CoNLL format (default are the "
+                             "fixtures)")
+    parser.add_argument("-r", "--raw", action='store_true',
+                        help="Accept raw result tags, for the input file")
+    parser.add_argument("-l", "--logfile", type=str, help="Log file path")
+
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+
+    args = arg_parser()
+    set_log_config(args.logfile, logging.INFO)
+    files = [(args.input_file, args.raw)] if args.input_file else None
+    check = CheckConllEval(files)
+    if check.run():
+        sys.exit(1)
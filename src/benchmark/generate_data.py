@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import io
+import os
+import time
+import random
+import argparse
+import logging
+
+from bisect import bisect_left
+from backports import csv
+
+from utils import import_config, set_log_config
+
+TWITTER_DATE = '%a %b %d %H:%M:%S +0000 %Y'
+# Start of the synthetic schedule: 2018-10-01 00:00:00 UTC
+START_EPOCH = 1538352000
+FIRST_TWEET_ID = 1046500000000000000
+
+SCHEDULE_TEMPLATES = [
+    (u'Now playing: ', u'{c}', u' - ', u'{w}', u' #classical'),
+    (u'#NowPlaying ', u'{w}', u' by ', u'{c}', u''),
+    (u'On air: ', u'{c}', u': ', u'{w}', u' - listen live!'),
+]
+UGC_WORDS = [
+    u'love', u'this', u'so', u'beautiful', u'the', u'a', u'listening', u'to',
+    u'now', u'morning', u'great', u'piece', u'wow', u'!', u'...', u'what',
+    u'lovely', u'music', u'on', u'@radio', u'thanks', u'for', u'playing',
+    u'my', u'favourite', u'always', u'#classical', u'today', u'evening']
+
+
+class SyntheticDataGenerator(object):
+    """
+    It generates synthetic data with the same format of the hydrated
+    corpora, for benchmarking without the original dataset:
+    1) SCHEDULE_<n>_<seed>_summary.csv: radio schedule tweets, one per track
+    2) UGC_<n>_<seed>_summary.csv: user-generated tweets
+    3) UGC_<n>_<seed>_entities.csv: entities annotated in the user-generated
+       tweets
+
+    The tracks are built from the gazetteers (composers from the first and
+    last names, works from the work types, notes and modes), and broadcast
+    one after the other with realistic durations. The user-generated tweets
+    are written while a track is on air or shortly after, and mention
+    its composer or work with partial, lowercased or misspelled forms,
+    or another track of the catalogue. The data only depends on the seed.
+
+    Usage:
+    python -m benchmark.generate_data
+    -n number of user-generated tweets (int)
+    [-s number of schedule tweets (int)]
+    [-o ../path/to/OUTPUT_DIR] [--seed seed (int)]
+
+    """
+    def __init__(self, ugc_rows, schedule_rows=None, outdir=None, seed=1):
+        """
+        """
+        self.cfg_feat = import_config('features')
+        self.cfg_bench = import_config('benchmark')
+
+        self.ugc_rows = ugc_rows
+        self.schedule_rows = schedule_rows or max(
+            1, ugc_rows // self.cfg_bench['tweets_per_track'])
+        self.outdir = outdir or self.cfg_bench['data_dir']
+        self.random = random.Random(seed)
+        # Cumulative popularity of the tracks of the catalogue
+        self.cumulative = []
+
+        self.schedule_file = os.path.join(
+            self.outdir, 'SCHEDULE_%d_%d_summary.csv' % (ugc_rows, seed))
+        self.ugc_file = os.path.join(
+            self.outdir, 'UGC_%d_%d_summary.csv' % (ugc_rows, seed))
+        self.ugc_ent_file = os.path.join(
+            self.outdir, 'UGC_%d_%d_entities.csv' % (ugc_rows, seed))
+
+    def import_gazetteer(self, name):
+        """
+        Import the entries of a gazetteer defined in the config
+        """
+        with io.open(self.cfg_feat[name], encoding='utf-8') as inf:
+            return [x.strip() for x in inf if x.strip()]
+
+    def build_catalogue(self):
+        """
+        Build the tracks of the catalogue, as (composer, work). Composers
+        are drawn from the last names, half of them with a first name.
+        """
+        firstnames = self.import_gazetteer('FIRST_NAMES_GAZ')
+        lastnames = self.import_gazetteer('LAST_NAMES_GAZ')
+        worktypes = self.import_gazetteer('WORK_TYPES_GAZ')
+        notes = self.import_gazetteer('NOTES_GAZ')
+        modes = self.import_gazetteer('MODES_GAZ')
+
+        catalogue = []
+        n_composers = min(len(lastnames), max(10, self.schedule_rows // 20))
+        for lastname in self.random.sample(lastnames, n_composers):
+            composer = lastname
+            if self.random.random() < 0.5:
+                composer = u'%s %s' % (self.random.choice(firstnames),
+                                       lastname)
+            for _ in range(self.random.randint(1, 8)):
+                worktype = self.random.choice(worktypes)
+                if self.random.random() < 0.6:
+                    work = u'%s No. %d in %s %s' % (
+                        worktype, self.random.randint(1, 40),
+                        self.random.choice(notes), self.random.choice(modes))
+                else:
+                    work = u'%s Op. %d' % (worktype,
+                                           self.random.randint(1, 120))
+                catalogue.append((composer, work))
+
+        return catalogue
+
+    def schedule_text(self, composer, work):
+        """
+        Build the text of a schedule tweet and the entities annotated
+        """
+        text = u''
+        entities = []
+        template = self.random.choice(SCHEDULE_TEMPLATES)
+        for part in template:
+            if part in (u'{c}', u'{w}'):
+                value, etype = ((composer, u'Contributor') if part == u'{c}'
+                                else (work, u'Work'))
+                entities.append(u'%d,%d,%s' % (len(text),
+                                               len(text) + len(value), etype))
+                text += value
+            else:
+                text += part
+
+        return text, entities
+
+    def mention(self, composer, work):
+        """
+        Choose how a user-generated tweet mentions a track: a list of
+        (text, entity type) with the composer and/or the work, as written
+        by a user
+        """
+        mentions = []
+        if self.random.random() < 0.7:
+            name = composer
+            if self.random.random() < 0.4:
+                # Surname only
+                name = composer.split()[-1]
+            if self.random.random() < 0.1 and len(name) > 3:
+                # Misspelled
+                i = self.random.randrange(1, len(name) - 1)
+                name = name[:i] + name[i + 1] + name[i] + name[i + 2:]
+            mentions.append((name, u'Contributor'))
+        if not mentions or self.random.random() < 0.6:
+            title = work
+            if self.random.random() < 0.3:
+                title = u' '.join(work.split()[:self.random.randint(1, 3)])
+            mentions.append((title, u'Work'))
+
+        self.random.shuffle(mentions)
+        if self.random.random() < 0.3:
+            mentions = [(x.lower(), etype) for x, etype in mentions]
+        return mentions
+
+    def ugc_text(self, mentions):
+        """
+        Build the text of a user-generated tweet around the mentions, and
+        the entities annotated
+        """
+        text = self.filler(self.random.randint(0, 4))
+        entities = []
+        for value, etype in mentions:
+            if text:
+                text += u' '
+            entities.append((len(text), len(text) + len(value), etype))
+            text += value + u' ' + self.filler(self.random.randint(1, 3))
+
+        return text, entities
+
+    def filler(self, n):
+        """
+        Return n random words of a user-generated tweet
+        """
+        return u' '.join(self.random.sample(UGC_WORDS, n))
+
+    def popular_track(self):
+        """
+        Draw a track of the catalogue, according to its popularity
+        """
+        r = self.random.random() * self.cumulative[-1]
+        return min(bisect_left(self.cumulative, r), len(self.cumulative) - 1)
+
+    def generate(self):
+        """
+        Generate the schedule and the user-generated tweets, writing the
+        three output files
+        """
+        if not os.path.isdir(self.outdir):
+            os.makedirs(self.outdir)
+
+        catalogue = self.build_catalogue()
+        # A few tracks are much more popular than the others
+        weights = [self.random.paretovariate(1.2) for _ in catalogue]
+        self.cumulative = []
+        acc = 0.0
+        for weight in weights:
+            acc += weight
+            self.cumulative.append(acc)
+
+        logging.info("Generating %d schedule tweets...", self.schedule_rows)
+        broadcasts = []
+        epoch = START_EPOCH
+        with io.open(self.schedule_file, 'w+', newline='',
+                     encoding='utf-8') as outf:
+            _writer = csv.writer(outf, quoting=csv.QUOTE_ALL)
+            _writer.writerow(['TWEET_ID', 'DATE', 'TEXT', 'ENT'])
+            for n in range(self.schedule_rows):
+                track = self.popular_track()
+                duration = int(self.random.uniform(180, 1800))
+                text, entities = self.schedule_text(*catalogue[track])
+                _writer.writerow(
+                    [unicode(FIRST_TWEET_ID + n),
+                     unicode(time.strftime(TWITTER_DATE,
+                                           time.gmtime(epoch))),
+                     text] + entities)
+                broadcasts.append((epoch, duration, track))
+                epoch += duration
+        logging.info("Done!")
+
+        logging.info("Generating %d user-generated tweets...", self.ugc_rows)
+        with io.open(self.ugc_file, 'w+', newline='',
+                     encoding='utf-8') as outf,\
+                io.open(self.ugc_ent_file, 'w+', newline='',
+                        encoding='utf-8') as outf_ent:
+            _writer = csv.writer(outf, quoting=csv.QUOTE_ALL)
+            _writer_ent = csv.writer(outf_ent, quoting=csv.QUOTE_ALL)
+            _writer.writerow(['TWEET_ID', 'DATE', 'TEXT', 'ENT'])
+            _writer_ent.writerow(['TWEET_ID', 'ENT', 'I', 'E', 'IOB_TAG',
+                                  'TYPE'])
+
+            for n in range(self.ugc_rows):
+                start, duration, track = self.random.choice(broadcasts)
+                # Tweeted while the track is on air, or shortly after
+                tweet_epoch = start + int(self.random.uniform(
+                    -60, duration + 600))
+                if self.random.random() < 0.2:
+                    # Mentioning another track of the catalogue
+                    track = self.popular_track()
+
+                tweet_id = unicode(FIRST_TWEET_ID + self.schedule_rows + n)
+                text, entities = self.ugc_text(
+                    self.mention(*catalogue[track]))
+                _writer.writerow(
+                    [tweet_id,
+                     unicode(time.strftime(TWITTER_DATE,
+                                           time.gmtime(tweet_epoch))),
+                     text] + [u'%d,%d,%s' % x for x in entities])
+
+                # Entities tokens in IOB format
+                for i, e, etype in entities:
+                    iob_tag = 'B'
+                    for token in text[i:e].split():
+                        _writer_ent.writerow([tweet_id, token, unicode(i),
+                                              unicode(i + len(token)),
+                                              iob_tag, etype])
+                        iob_tag = 'I'
+                        i += len(token) + 1
+        logging.info("Done!")
+
+
+def arg_parser():
+    """
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--ugc-rows", type=int, dest='ugc_rows',
+                        help="Number of user-generated tweets")
+    parser.add_argument("-s", "--schedule-rows", type=int,
+                        dest='schedule_rows',
+                        help="Number of schedule tweets")
+    parser.add_argument("-o", "--output-dir", type=str, dest='outdir',
+                        help="Output directory")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed of the random generator")
+    parser.add_argument("-l", "--logfile", type=str, help="Log file path")
+
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+
+    args = arg_parser()
+    set_log_config(args.logfile, logging.INFO)
+    if not args.ugc_rows:
+        logging.error("Please insert option -n (number of user-generated "
+                      "tweets)")
+    else:
+        generator = SyntheticDataGenerator(args.ugc_rows,
+                                           args.schedule_rows,
+                                           args.outdir,
+                                           args.seed)
+        generator.generate()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import io
+import os
+import sys
+import json
+import argparse
+import logging
+import resource
+
+from benchmark.generate_data import SyntheticDataGenerator
+from schedule_matcher import ScheduleMatcher
+from utils import import_config, set_log_config
+
+# Number of UG tweets whose memory is estimated from the measures
+TARGET_ROWS = 10000000
+
+
+def deep_size(obj):
+    """
+    Return the bytes taken by an object and by all the objects it
+    contains (items of tuples and lists, keys and values of Dicts),
+    counting each object once
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (tuple, list)):
+            stack.extend(obj)
+
+    return size
+
+
+def resident_memory():
+    """
+    Return the resident memory of the process in bytes (Linux only)
+    """
+    with open('/proc/self/statm') as inf:
+        return int(inf.read().split()[1]) * resource.getpagesize()
+
+
+class MemoryReport(object):
+    """
+    It measures the memory taken by the UGC tweets and by the schedule
+    imported by schedule_matcher.py, on synthetic data of a given scale.
+    For each Dict it reports the bytes per tweet of its records, walking
+    their objects with sys.getsizeof, compared with the Dict of Dicts
+    with string keys used before, and the growth of the resident memory
+    while importing it. The memory needed for TARGET_ROWS UG tweets is
+    estimated from these measures. The report is written in JSON in the
+    file defined in the config.
+
+    Usage:
+    python -m benchmark.memory_report
+    -n number of user-generated tweets (int)
+    [--seed seed (int)]
+
+    """
+    def __init__(self, ugc_rows, seed=1):
+        """
+        """
+        self.cfg_bench = import_config('benchmark')
+
+        self.ugc_rows = ugc_rows
+        self.seed = seed
+        self.outfile = self.cfg_bench['memory_report_file']
+
+    def dict_ugc_tweets(self, DictTweets):
+        """
+        Convert the UGC tweets to the Dict of Dicts used before
+        """
+        return dict((tweet_id.decode('utf-8'),
+                     {'created_at': tweet.created_at,
+                      'text': tweet.text,
+                      'entities': tweet.entities})
+                    for tweet_id, tweet in DictTweets.iteritems())
+
+    def dict_schedule(self, DictSched):
+        """
+        Convert the schedule tweets to the Dict of Dicts used before
+        """
+        return dict((sch_tweet_id,
+                     {'created_at': sch_tweet.created_at,
+                      'text': sch_tweet.text,
+                      'entities': sch_tweet.entities})
+                    for sch_tweet_id, sch_tweet in DictSched.iteritems())
+
+    def measure(self, name, layout, Dict, rss=None):
+        """
+        Measure the memory taken by a Dict of tweets
+        """
+        size = deep_size(Dict)
+        return {'dict': name,
+                'layout': layout,
+                'tweets': len(Dict),
+                'bytes_per_tweet': size // max(1, len(Dict)),
+                'sizeof_mb': round(size / 2.0**20, 1),
+                'rss_mb': round(rss / 2.0**20, 1) if rss is not None
+                else None}
+
+    def run(self):
+        """
+        Import the synthetic data of the scale with the matcher, measure
+        the memory of each Dict in both layouts, and write the report
+        """
+        data = SyntheticDataGenerator(self.ugc_rows, outdir=self.cfg_bench[
+            'data_dir'], seed=self.seed)
+        if not all(os.path.isfile(x) for x in (data.schedule_file,
+                                               data.ugc_file)):
+            data.generate()
+
+        # Only the schedule is imported by the matcher, then the UG tweets
+        rss = resident_memory()
+        matcher = ScheduleMatcher(None, data.schedule_file, None,
+                                  self.cfg_bench['work_tsl'],
+                                  self.cfg_bench['contr_tsl'],
+                                  self.cfg_bench['time_tsl'])
+        sched_rss = resident_memory() - rss
+
+        matcher.input_file = data.ugc_file
+        rss = resident_memory()
+        DictTweets = matcher.import_ugc_tweets()
+        ugc_rss = resident_memory() - rss
+
+        logging.info("Measuring memory...")
+        results = [
+            self.measure('ugc', 'dict', self.dict_ugc_tweets(DictTweets)),
+            self.measure('ugc', 'record', DictTweets, ugc_rss),
+            self.measure('schedule', 'dict',
+                         self.dict_schedule(matcher.DictSched)),
+            self.measure('schedule', 'record', matcher.DictSched,
+                         sched_rss)]
+        logging.info("Done!")
+
+        logging.info("%-10s %8s %10s %12s %10s %10s", 'dict', 'layout',
+                     'tweets', 'bytes/tweet', 'sizeof_mb', 'rss_mb')
+        for result in results:
+            logging.info("%-10s %8s %10d %12d %10.1f %10s",
+                         result['dict'], result['layout'], result['tweets'],
+                         result['bytes_per_tweet'], result['sizeof_mb'],
+                         result['rss_mb'] if result['rss_mb'] is not None
+                         else '-')
+        for result in results[:2]:
+            result['target_gb'] = round(
+                result['bytes_per_tweet'] * TARGET_ROWS / 2.0**30, 2)
+            logging.info("Estimated memory of %d UG tweets (%s): %.2f GB",
+                         TARGET_ROWS, result['layout'], result['target_gb'])
+
+        with io.open(self.outfile, 'w+', encoding='utf-8') as outf:
+            outf.write(unicode(json.dumps(
+                {'ugc_rows': self.ugc_rows, 'seed': self.seed,
+                 'results': results}, indent=2, sort_keys=True)))
+        logging.info("Report written in %s", self.outfile)
+
+
+def arg_parser():
+    """
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--ugc-rows", type=int, dest='ugc_rows',
+                        help="Number of user-generated tweets")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed of the data generator")
+    parser.add_argument("-l", "--logfile", type=str, help="Log file path")
+
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+
+    args = arg_parser()
+    set_log_config(args.logfile, logging.INFO)
+    if not args.ugc_rows:
+        logging.error("Please insert option -n (number of user-generated "
+                      "tweets)")
+    else:
+        report = MemoryReport(args.ugc_rows, args.seed)
+        report.run()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import io
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+import logging
+import subprocess
+
+from timeit import default_timer
+
+from benchmark.generate_data import SyntheticDataGenerator
+from utils import import_config, set_log_config
+
+TOOLS = ['matcher', 'features']
+
+
+class BenchmarkRunner(object):
+    """
+    It times schedule_matcher.py and extract_features.py on synthetic data
+    at several scales (number of user-generated tweets), generating the
+    data when missing. Each tool runs in its own process, and the wall
+    time, throughput and peak memory of each run are appended in JSON
+    lines to the results file, so that runs of different versions can be
+    compared. The default scales, thresholds and paths are defined in the
+    config.
+
+    Usage:
+    python -m benchmark.run_benchmark
+    [-s sizes (comma-separated ints)]
+    [-t matcher,features]
+    [-a "extra schedule_matcher.py options"]
+    [--seed seed (int)]
+
+    """
+    def __init__(self, sizes=None, tools=None, matcher_args='', seed=1):
+        """
+        """
+        self.cfg_bench = import_config('benchmark')
+
+        self.sizes = sizes or self.cfg_bench['sizes']
+        self.tools = tools or TOOLS
+        self.matcher_args = shlex.split(matcher_args or '')
+        self.seed = seed
+        self.data_dir = self.cfg_bench['data_dir']
+        self.results_file = self.cfg_bench['results_file']
+        self.revision = self.git_revision()
+
+    def git_revision(self):
+        """
+        Get the current git revision of the code, if available
+        """
+        try:
+            with open(os.devnull, 'w') as devnull:
+                return subprocess.check_output(
+                    ['git', 'rev-parse', '--short', 'HEAD'],
+                    stderr=devnull).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def prepare_data(self, size):
+        """
+        Generate the synthetic data of a scale, unless already generated
+        """
+        generator = SyntheticDataGenerator(size, outdir=self.data_dir,
+                                           seed=self.seed)
+        if not all(os.path.isfile(x) for x in (generator.schedule_file,
+                                               generator.ugc_file,
+                                               generator.ugc_ent_file)):
+            generator.generate()
+
+        return generator
+
+    def command(self, tool, data):
+        """
+        Get the command running a tool on the data of a scale, and its
+        log file
+        """
+        logfile = os.path.join(self.data_dir, '%s_%d.log' % (
+            tool, data.ugc_rows))
+        if tool == 'matcher':
+            return [sys.executable, 'schedule_matcher.py',
+                    '-w', str(self.cfg_bench['work_tsl']),
+                    '-c', str(self.cfg_bench['contr_tsl']),
+                    '-t', str(self.cfg_bench['time_tsl']),
+                    '-i', data.ugc_file,
+                    '-s', data.schedule_file,
+                    '-l', logfile] + self.matcher_args
+
+        return [sys.executable, 'extract_features.py',
+                '-i', data.ugc_file,
+                '-e', data.ugc_ent_file,
+                '-o', os.path.join(self.data_dir, 'WEKA_%d.csv' %
+                                   data.ugc_rows),
+                '-n', os.path.join(self.data_dir, 'NN_%d.csv' %
+                                   data.ugc_rows),
+                '-l', logfile]
+
+    def run_tool(self, tool, data):
+        """
+        Run a tool, and return its result: wall time, throughput, peak
+        memory and exit status
+        """
+        cmd = self.command(tool, data)
+        logging.info("Running %s on %d tweets...", tool, data.ugc_rows)
+
+        start = default_timer()
+        process = subprocess.Popen(cmd)
+        # Resource usage of this process only, not of the previous ones
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = default_timer() - start
+
+        returncode = (os.WEXITSTATUS(status) if os.WIFEXITED(status)
+                      else -os.WTERMSIG(status))
+        if returncode:
+            logging.error("%s failed with status %d, see %s", tool,
+                          returncode, cmd[cmd.index('-l') + 1])
+
+        return {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'revision': self.revision,
+                'tool': tool,
+                'ugc_rows': data.ugc_rows,
+                'schedule_rows': data.schedule_rows,
+                'seconds': round(seconds, 3),
+                'rows_per_second': round(data.ugc_rows / seconds, 1),
+                'max_rss_kb': usage.ru_maxrss,
+                'returncode': returncode,
+                'args': cmd[2:]}
+
+    def write_result(self, result):
+        """
+        Append a result to the results file
+        """
+        with io.open(self.results_file, 'a', encoding='utf-8') as outf:
+            outf.write(unicode(json.dumps(result, sort_keys=True)) + u'\n')
+
+    def run(self):
+        """
+        Run each tool at each scale, logging a summary of the results
+        """
+        results = []
+        for size in self.sizes:
+            data = self.prepare_data(size)
+            for tool in self.tools:
+                result = self.run_tool(tool, data)
+                self.write_result(result)
+                results.append(result)
+
+        logging.info("Results appended to %s", self.results_file)
+        logging.info("%-10s %10s %10s %12s %12s %6s", 'tool', 'rows',
+                     'seconds', 'rows/s', 'max_rss_kb', 'status')
+        for result in results:
+            logging.info("%-10s %10d %10.2f %12.1f %12d %6d",
+                         result['tool'], result['ugc_rows'],
+                         result['seconds'], result['rows_per_second'],
+                         result['max_rss_kb'], result['returncode'])
+
+
+def parse_sizes(value):
+    """
+    Parse a comma-separated list of scales
+    """
+    return [int(x) for x in value.split(',')]
+
+
+def parse_tools(value):
+    """
+    Parse a comma-separated list of tools
+    """
+    tools = value.split(',')
+    for tool in tools:
+        if tool not in TOOLS:
+            raise argparse.ArgumentTypeError("unknown tool %s" % tool)
+    return tools
+
+
+def arg_parser():
+    """
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sizes", type=parse_sizes,
+                        help="Comma-separated numbers of user-generated "
+                             "tweets")
+    parser.add_argument("-t", "--tools", type=parse_tools,
+                        help="Comma-separated tools to run (matcher, "
+                             "features)")
+    parser.add_argument("-a", "--matcher-args", type=str,
+                        dest='matcher_args',
+                        help="Extra options of schedule_matcher.py")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed of the data generator")
+    parser.add_argument("-l", "--logfile", type=str, help="Log file path")
+
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+
+    args = arg_parser()
+    set_log_config(args.logfile, logging.INFO)
+    runner = BenchmarkRunner(args.sizes,
+                             args.tools,
+                             args.matcher_args,
+                             args.seed)
+    runner.run()
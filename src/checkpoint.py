@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import logging
+import hashlib
+import cPickle
+
+from summary_loader import parse_chunk
+
+CHECKPOINT_VERSION = 1
+# Size of the blocks read when hashing the input files
+BLOCK_SIZE = 1 << 20
+
+
+def hash_range(md5, path, start, end):
+    """
+    Update a digest with the content of a file in a byte range
+    """
+    with open(path, 'rb') as inf:
+        inf.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = inf.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            md5.update(block)
+            remaining -= len(block)
+
+    return md5
+
+
+def rows_end(path):
+    """
+    Return the offset after the last newline of a file, i.e. the end of
+    its last row terminated
+    """
+    with open(path, 'rb') as inf:
+        inf.seek(0, os.SEEK_END)
+        end = inf.tell()
+        while end > 0:
+            start = max(0, end - BLOCK_SIZE)
+            inf.seek(start)
+            block = inf.read(end - start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+
+    return 0
+
+
+class MatchCheckpoint(object):
+    """
+    Checkpoint of an incremental matching run, for input files which only
+    grow by appending rows. It stores, for each input file, the offset up
+    to which it has been read and the digest of its content so far, the
+    last creation date processed and the results of each UG tweet (the
+    lines in CoNLL format and, in top-k mode, the ranking).
+
+    The checkpoint is discarded when the parameters of the run change, and
+    its results when the content read of an input file has changed.
+    """
+    def __init__(self, path, params):
+        """
+        """
+        self.path = path
+        self.params = params
+        # Offset and digest of each input file
+        self.files = {}
+        self.last_epoch = None
+        self.results = {}
+
+    def load(self):
+        """
+        Load the checkpoint of the previous run, if any and made with the
+        same parameters
+        """
+        if not os.path.isfile(self.path):
+            return
+
+        logging.info("Loading checkpoint %s...", self.path)
+        with open(self.path, 'rb') as inf:
+            state = cPickle.load(inf)
+        if state['version'] != CHECKPOINT_VERSION or \
+                state['params'] != self.params:
+            logging.info("Checkpoint made with other parameters, ignored")
+            return
+
+        self.files = state['files']
+        self.last_epoch = state['last_epoch']
+        self.results = state['results']
+        logging.info("Loaded the results of %d tweets", len(self.results))
+
+    def save(self):
+        """
+        Save the checkpoint for the next run. It is written in a temporary
+        file first, so that a failed run keeps the previous checkpoint.
+        """
+        logging.info("Saving checkpoint %s...", self.path)
+        state = {'version': CHECKPOINT_VERSION,
+                 'params': self.params,
+                 'files': self.files,
+                 'last_epoch': self.last_epoch,
+                 'results': self.results}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as outf:
+            cPickle.dump(state, outf, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self.path)
+        logging.info("Done!")
+
+    def appended_ids(self, name, path):
+        """
+        Return the tweet IDs, encoded in UTF-8, of the rows appended to a
+        summary file since the checkpoint. Only the appended rows are
+        parsed. It returns None when all the rows are new: when the file
+        has not been checkpointed yet, or when the content checkpointed
+        has changed, in which case the results are discarded. A last row
+        not yet terminated is left for the next run.
+        """
+        offset, digest = self.files.get(name, (0, None))
+        end = rows_end(path)
+        md5 = hashlib.md5()
+        if offset:
+            if end < offset or \
+                    hash_range(md5, path, 0, offset).hexdigest() != digest:
+                logging.info("%s has changed since the checkpoint, "
+                             "matching all the tweets", path)
+                self.results = {}
+                offset = 0
+                md5 = hashlib.md5()
+        hash_range(md5, path, offset, end)
+        self.files[name] = (end, md5.hexdigest())
+
+        if not offset:
+            return None
+        return parse_chunk((path, offset, end, None, False, False)).ids
+
+
+class HydrationCheckpoint(object):
+    """
+    Checkpoint of a hydration run. It stores the number of input tweets
+    whose output has been written, the number of tweets missing among
+    them and the size of each output file then, after flushing the files
+    to disk, so that a run stopped at any point can be resumed by
+    truncating the output files to these sizes and appending the rest.
+
+    The checkpoint is discarded when the parameters of the run (the
+    digest of the input tweets) change, or when an output file is shorter
+    than checkpointed.
+    """
+    def __init__(self, path, params):
+        """
+        """
+        self.path = path
+        self.params = params
+        self.index = 0
+        self.missing = 0
+        # Size of each output file
+        self.sizes = {}
+
+    def load(self):
+        """
+        Load the checkpoint of the previous run, if any and made with the
+        same parameters. It returns whether it has been loaded.
+        """
+        if not os.path.isfile(self.path):
+            logging.info("No checkpoint %s, starting from the beginning",
+                         self.path)
+            return False
+
+        with open(self.path, 'rb') as inf:
+            state = cPickle.load(inf)
+        if state['version'] != CHECKPOINT_VERSION or \
+                state['params'] != self.params:
+            logging.error("Checkpoint made with other parameters, "
+                          "starting from the beginning")
+            return False
+        for path, size in state['sizes'].iteritems():
+            if not os.path.isfile(path) or os.path.getsize(path) < size:
+                logging.error("%s is shorter than checkpointed, starting "
+                              "from the beginning", path)
+                return False
+
+        self.index = state['index']
+        self.missing = state['missing']
+        self.sizes = state['sizes']
+        logging.info("Resuming from tweet %d", self.index)
+        return True
+
+    def truncate(self):
+        """
+        Truncate the output files to their checkpointed sizes, dropping
+        the rows written after the checkpoint
+        """
+        for path, size in self.sizes.iteritems():
+            with open(path, 'r+b') as outf:
+                outf.truncate(size)
+
+    def save(self, index, missing, outfiles):
+        """
+        Flush the output files to disk and save the checkpoint. It is
+        written in a temporary file first and renamed, so that a crash
+        keeps the previous checkpoint.
+        """
+        for outf in outfiles:
+            outf.flush()
+            os.fsync(outf.fileno())
+        self.index = index
+        self.missing = missing
+        self.sizes = dict((outf.name, os.fstat(outf.fileno()).st_size)
+                          for outf in outfiles)
+
+        state = {'version': CHECKPOINT_VERSION,
+                 'params': self.params,
+                 'index': self.index,
+                 'missing': self.missing,
+                 'sizes': self.sizes}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as outf:
+            cPickle.dump(state, outf, cPickle.HIGHEST_PROTOCOL)
+            outf.flush()
+            os.fsync(outf.fileno())
+        os.rename(tmp_path, self.path)
+
+        # Flush the rename to disk
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)),
+                         os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
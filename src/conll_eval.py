@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import io
+import sys
+import argparse
+
+from collections import defaultdict
+
+BOUNDARY = '-X-'
+
+
+def split_tag(tag):
+    """
+    Split a chunk tag into IOB prefix and type, e.g. B-Work -> (B, Work)
+    """
+    if '-' in tag:
+        return tuple(tag.split('-', 1))
+    return tag, ''
+
+
+def end_of_chunk(prev_tag, tag, prev_type, etype):
+    """
+    Check if a chunk ended between the previous and current word
+    """
+    if prev_tag in ('B', 'I') and tag in ('B', 'O'):
+        return True
+    if prev_tag == 'E' and tag in ('E', 'I', 'O'):
+        return True
+    if prev_tag not in ('O', '.') and prev_type != etype:
+        return True
+    # Chunks assumed to have length 1
+    if prev_tag in (']', '['):
+        return True
+
+    return False
+
+
+def start_of_chunk(prev_tag, tag, prev_type, etype):
+    """
+    Check if a chunk started between the previous and current word
+    """
+    if prev_tag in ('B', 'I', 'O') and tag == 'B':
+        return True
+    if prev_tag == 'O' and tag in ('I', 'E'):
+        return True
+    if prev_tag == 'E' and tag in ('E', 'I'):
+        return True
+    if tag not in ('O', '.') and prev_type != etype:
+        return True
+    # Chunks assumed to have length 1
+    if tag in ('[', ']'):
+        return True
+
+    return False
+
+
+class ConllEval(object):
+    """
+    Chunk-level evaluation of tagged tokens, computing the same counts,
+    precision, recall and FB1 of the conlleval script. Tokens are added
+    incrementally, with sentences separated by boundaries, or as lines of
+    a file in CoNLL format. The options are the same of conlleval:
+    raw: accept raw result tags (without B- and I- prefix)
+    delimiter: field delimiter (default is single space)
+    o_tag: alternative outside tag (default is O)
+
+    Usage:
+    python conll_eval.py [-r] [-d delimiter] [-o o_tag]
+    [-i ../path/to/RESULTS.txt] (default is the standard input)
+
+    """
+    def __init__(self, raw=False, delimiter=' ', o_tag='O'):
+        """
+        """
+        self.raw = raw
+        self.delimiter = delimiter
+        self.o_tag = o_tag
+        self.nbr_features = -1
+
+        self.correct_chunk = 0
+        self.correct_tags = 0
+        self.found_correct = 0
+        self.found_guessed = 0
+        self.token_counter = 0
+
+        self.correct_chunk_type = defaultdict(int)
+        self.found_correct_type = defaultdict(int)
+        self.found_guessed_type = defaultdict(int)
+
+        self.in_correct = False
+        self.last_correct = 'O'
+        self.last_guessed = 'O'
+        self.last_correct_type = ''
+        self.last_guessed_type = ''
+
+    def add(self, token, correct_tag, guessed_tag):
+        """
+        Add a token with its correct and guessed chunk tags
+        """
+        correct, correct_type = split_tag(correct_tag)
+        guessed, guessed_type = split_tag(guessed_tag)
+
+        # Sentence breaks are always counted as out of chunk
+        if token == BOUNDARY:
+            guessed = 'O'
+
+        correct_end = end_of_chunk(self.last_correct, correct,
+                                   self.last_correct_type, correct_type)
+        guessed_end = end_of_chunk(self.last_guessed, guessed,
+                                   self.last_guessed_type, guessed_type)
+        correct_start = start_of_chunk(self.last_correct, correct,
+                                       self.last_correct_type, correct_type)
+        guessed_start = start_of_chunk(self.last_guessed, guessed,
+                                       self.last_guessed_type, guessed_type)
+
+        if self.in_correct:
+            if (correct_end and guessed_end and
+                    self.last_guessed_type == self.last_correct_type):
+                self.in_correct = False
+                self.correct_chunk += 1
+                self.correct_chunk_type[self.last_correct_type] += 1
+            elif correct_end != guessed_end or guessed_type != correct_type:
+                self.in_correct = False
+
+        if correct_start and guessed_start and guessed_type == correct_type:
+            self.in_correct = True
+
+        if correct_start:
+            self.found_correct += 1
+            self.found_correct_type[correct_type] += 1
+        if guessed_start:
+            self.found_guessed += 1
+            self.found_guessed_type[guessed_type] += 1
+
+        if token != BOUNDARY:
+            if correct == guessed and guessed_type == correct_type:
+                self.correct_tags += 1
+            self.token_counter += 1
+
+        self.last_guessed = guessed
+        self.last_correct = correct
+        self.last_guessed_type = guessed_type
+        self.last_correct_type = correct_type
+
+    def add_line(self, line):
+        """
+        Add a line of a file in CoNLL format, whose last two fields are the
+        correct and the guessed tags. Empty lines are sentence boundaries.
+        """
+        if line.endswith('\n'):
+            line = line[:-1]
+        features = line.split(self.delimiter)
+        # Trailing empty fields are ignored
+        while features and not features[-1]:
+            features.pop()
+
+        if self.nbr_features < 0:
+            self.nbr_features = len(features) - 1
+        elif self.nbr_features != len(features) - 1 and features:
+            raise ValueError("unexpected number of features: %d (%d)" % (
+                len(features), self.nbr_features + 1))
+
+        if not features or features[0] == BOUNDARY:
+            features = [BOUNDARY, 'O', 'O']
+        if len(features) < 2:
+            raise ValueError(
+                "unexpected number of features in line %s" % line)
+
+        guessed, correct = features[-1], features[-2]
+        if self.raw:
+            guessed = self.raw_tag(guessed)
+            correct = self.raw_tag(correct)
+
+        token = features[0] if len(features) > 2 else None
+        self.add(token, correct, guessed)
+
+    def raw_tag(self, tag):
+        """
+        Convert a raw tag to a chunk tag of length one
+        """
+        if tag == self.o_tag:
+            return 'O'
+        elif tag != 'O':
+            return 'B-%s' % tag
+        return tag
+
+    def add_file(self, inf):
+        """
+        Add all the lines of a file in CoNLL format
+        """
+        for line in inf:
+            self.add_line(line)
+
+    def add_boundary(self):
+        """
+        Add a sentence boundary
+        """
+        self.add(BOUNDARY, 'O', 'O')
+
+    def update(self, other):
+        """
+        Add the counts of another evaluation, made on the following
+        sentences. Both must end with a sentence boundary.
+        """
+        self.correct_chunk += other.correct_chunk
+        self.correct_tags += other.correct_tags
+        self.found_correct += other.found_correct
+        self.found_guessed += other.found_guessed
+        self.token_counter += other.token_counter
+
+        for counts, other_counts in (
+                (self.correct_chunk_type, other.correct_chunk_type),
+                (self.found_correct_type, other.found_correct_type),
+                (self.found_guessed_type, other.found_guessed_type)):
+            for etype in other_counts:
+                counts[etype] += other_counts[etype]
+
+    def finish(self):
+        """
+        Count the chunk still open at the end of the input. To be called
+        once, after the last token.
+        """
+        if self.in_correct:
+            self.in_correct = False
+            self.correct_chunk += 1
+            self.correct_chunk_type[self.last_correct_type] += 1
+
+    def overall(self):
+        """
+        Return overall precision, recall and FB1 (in percentage)
+        """
+        return prf(self.correct_chunk, self.found_guessed,
+                   self.found_correct)
+
+    def by_type(self):
+        """
+        Return a Dict with precision, recall and FB1 (in percentage) and
+        the number of chunks found for each chunk type
+        """
+        scores = {}
+        for etype in sorted(set(self.found_correct_type) |
+                            set(self.found_guessed_type)):
+            scores[etype] = prf(self.correct_chunk_type.get(etype, 0),
+                                self.found_guessed_type.get(etype, 0),
+                                self.found_correct_type.get(etype, 0)) + (
+                                    self.found_guessed_type.get(etype, 0),)
+        return scores
+
+    def report(self):
+        """
+        Return the evaluation report, formatted as the one of conlleval
+        """
+        lines = ["processed %d tokens with %d phrases; found: %d phrases; "
+                 "correct: %d.\n" % (self.token_counter, self.found_correct,
+                                     self.found_guessed, self.correct_chunk)]
+        if self.token_counter > 0:
+            lines.append(
+                "accuracy: %6.2f%%; precision: %6.2f%%; recall: %6.2f%%; "
+                "FB1: %6.2f\n" % ((
+                    100.0*self.correct_tags/self.token_counter,) +
+                    self.overall()))
+
+        # As in conlleval, the empty type is listed once for each
+        # of correct and guessed chunks where it appears
+        by_type = self.by_type()
+        etypes = []
+        for etype in sorted(list(self.found_correct_type) +
+                            list(self.found_guessed_type)):
+            if not etypes or not etypes[-1] or etypes[-1] != etype:
+                etypes.append(etype)
+
+        for etype in etypes:
+            lines.append("%17s: precision: %6.2f%%; recall: %6.2f%%; "
+                         "FB1: %6.2f  %d\n" % ((etype,) + by_type[etype]))
+
+        return ''.join(lines)
+
+
+def prf(correct, guessed, found):
+    """
+    Compute precision, recall and FB1 (in percentage)
+    """
+    precision = 100.0*correct/guessed if guessed else 0.0
+    recall = 100.0*correct/found if found else 0.0
+    if precision + recall:
+        fb1 = 2*precision*recall/(precision + recall)
+    else:
+        fb1 = 0.0
+
+    return precision, recall, fb1
+
+
+def arg_parser():
+    """
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", type=str, dest='input_file',
+                        help="Input file in CoNLL format (default is the "
+                             "standard input)")
+    parser.add_argument("-r", "--raw", action='store_true',
+                        help="Accept raw result tags")
+    parser.add_argument("-d", "--delimiter", type=str, default=' ',
+                        help="Field delimiter")
+    parser.add_argument("-o", "--o-tag", type=str, dest='o_tag', default='O',
+                        help="Alternative outside tag")
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+
+    args = arg_parser()
+
+    evaluation = ConllEval(args.raw, args.delimiter, args.o_tag)
+    try:
+        if args.input_file:
+            with io.open(args.input_file, encoding='utf-8') as inf:
+                evaluation.add_file(inf)
+        else:
+            evaluation.add_file(sys.stdin)
+    except ValueError, err:
+        sys.stderr.write("%s\n" % err)
+        sys.exit(1)
+    evaluation.finish()
+
+    sys.stdout.write(evaluation.report())
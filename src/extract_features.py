@@ -5,8 +5,10 @@ import io
 import argparse
 import logging
 from backports import csv
+from itertools import izip
 
 from pos_chunk_twitter_nlp import PosChunkTagger
+from summary_loader import load_summary
 from utils import import_config, set_log_config
 
 
@@ -24,9 +26,14 @@ class ExtractFeatures(object):
     -e ../path/to/INPUTFILE_entities.csv
     -o ../path/to/OUTPUTFILE_WEKA.csv
     -n ../path/to/OUTPUTFILE_NeuralNetworks.csv
+    [--workers N]
+
+    With --workers the input file is loaded in chunks by a pool of
+    processes.
     """
 
-    def __init__(self, input_file, input_ent, output_weka, output_nn, limit):
+    def __init__(self, input_file, input_ent, output_weka, output_nn, limit,
+                 workers=1):
         """
         """
         self.input_file = input_file
@@ -34,6 +41,7 @@ class ExtractFeatures(object):
         self.out_weka = output_weka
         self.out_nn = output_nn
         self.limit = limit
+        self.workers = workers
 
         self.cfg_feat = import_config('features')
         self.gazzetters = self.import_gazetters()
@@ -289,7 +297,7 @@ class ExtractFeatures(object):
         logging.info('Importing Annotated Entities...')
         DictEntities = {}
 
-        with io.open(self.input_ent) as inf:
+        with io.open(self.input_ent, newline='', encoding='utf-8') as inf:
             _reader = csv.reader(inf)
             next(_reader)
             for line in _reader:
@@ -351,52 +359,48 @@ class ExtractFeatures(object):
         count = 0
         max_len = 0
 
-        with io.open(self.input_file, newline='', encoding='utf-8') as inf:
-            _reader = csv.reader(inf)
-            next(_reader)
+        columns = load_summary(self.input_file, self.workers, self.limit,
+                               parse_dates=False)
 
-            # Iterate over User Generate Tweets
-            for row in _reader:
-                tweet_id, creation_date, text = row[0:3]
+        # Iterate over User Generate Tweets
+        for tweet_id, text in izip(columns.ids, columns.texts):
+            tweet_id, text = tweet_id.decode('utf-8'), text.decode('utf-8')
 
-                # Break if limit is reached
-                if self.limit and count > self.limit-1:
-                    break
-                if count == 0:
-                    logging.info("Processing tweets...")
-                elif count % 250 == 0:
-                    logging.info("Processed %d tweets", count)
-                count += 1
+            if count == 0:
+                logging.info("Processing tweets...")
+            elif count % 250 == 0:
+                logging.info("Processed %d tweets", count)
+            count += 1
 
-                # Extract POS and Chunk TAG
-                self.tokens_tagged = self.tagger.tag_sentence(text)
+            # Extract POS and Chunk TAG
+            self.tokens_tagged = self.tagger.tag_sentence(text)
 
-                # Get max tweet lenght for normalization
-                if len(self.tokens_tagged) > max_len:
-                    max_len = len(self.tokens_tagged)
+            # Get max tweet lenght for normalization
+            if len(self.tokens_tagged) > max_len:
+                max_len = len(self.tokens_tagged)
 
-                # Add Entities annotations to tokens
-                self.get_entities_annotated(tweet_id, text)
+            # Add Entities annotations to tokens
+            self.get_entities_annotated(tweet_id, text)
 
-                # Add Boolean features to tokens
-                self.get_boolean_features()
+            # Add Boolean features to tokens
+            self.get_boolean_features()
 
-                # Add tweet_id
-                for i, token_tagged in enumerate(self.tokens_tagged):
-                    self.tokens_tagged[i] = token_tagged + (tweet_id,)
+            # Add tweet_id
+            for i, token_tagged in enumerate(self.tokens_tagged):
+                self.tokens_tagged[i] = token_tagged + (tweet_id,)
 
-                self.out_tokens += self.tokens_tagged
+            self.out_tokens += self.tokens_tagged
 
-            logging.info("Processed %d tweets", count)
-            logging.info("Done!")
+        logging.info("Processed %d tweets", count)
+        logging.info("Done!")
 
-            # Add contextual features to tokens
-            self.get_contextual_features()
-            self.normalize_position(max_len)
+        # Add contextual features to tokens
+        self.get_contextual_features()
+        self.normalize_position(max_len)
 
-            # Write output files
-            self.write_weka()
-            self.write_NN()
+        # Write output files
+        self.write_weka()
+        self.write_NN()
 
 
 def arg_parser():
@@ -415,6 +419,9 @@ def arg_parser():
                         help="Log file path")
     parser.add_argument("-L", "--limit", type=int, dest='limit',
                         help="Limit number of tweet to process")
+    parser.add_argument("-j", "--workers", type=int, dest='workers',
+                        default=1,
+                        help="Number of processes loading the input file")
     args = parser.parse_args()
 
     return args
@@ -429,6 +436,7 @@ if __name__ == '__main__':
                          args.input_ent,
                          args.output_weka,
                          args.output_nn,
-                         args.limit)
+                         args.limit,
+                         args.workers)
 
     ef.run()
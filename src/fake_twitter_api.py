@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import time
+import threading
+
+from itertools import izip
+from twitter import Status
+from twitter.error import TwitterError
+from twitter.ratelimit import RateLimit
+
+from rate_limiter import Clock, RATE_LIMIT_CODE
+from summary_loader import load_summary
+
+TWITTER_DATE = '%a %b %d %H:%M:%S +0000 %Y'
+# Maximum number of IDs of a lookup request
+MAX_LOOKUP_IDS = 100
+
+
+class FakeTwitterApi(object):
+    """
+    Offline stand-in of twitter.Api for hydrating tweets without
+    connecting to Twitter. The statuses are the tweets of a summary file,
+    and the tweets which are not in the file are missing, as the deleted
+    ones. It counts the requests made, as the real API would.
+
+    With a limit, each endpoint allows limit requests per window of
+    seconds of the clock (e.g. a SimulatedClock): it sets the rate limit
+    of the endpoint after each request, as read from the headers by
+    twitter.Api, and fails with error code 88 when the limit is reached.
+    """
+    base_url = 'https://api.twitter.com/1.1'
+
+    def __init__(self, statuses, limit=None, window=900, clock=None):
+        """
+        """
+        self.statuses = statuses
+        self.limit = limit
+        self.window = window
+        self.clock = clock or Clock()
+        self.rate_limit = RateLimit()
+        self.lock = threading.Lock()
+        # Reset time and remaining requests of each endpoint
+        self.windows = {}
+        self.requests = 0
+        self.rate_limited = 0
+
+    @classmethod
+    def from_summary(cls, path, **kwargs):
+        """
+        Create the API with the tweets of a summary file
+        """
+        columns = load_summary(path)
+        statuses = {}
+        for tweet_id, epoch, text in izip(columns.ids, columns.epochs,
+                                          columns.texts):
+            statuses[int(tweet_id)] = Status(
+                id=int(tweet_id),
+                created_at=time.strftime(TWITTER_DATE, time.gmtime(epoch)),
+                full_text=text.decode('utf-8'))
+
+        return cls(statuses, **kwargs)
+
+    def request(self, endpoint):
+        """
+        Count a request to an endpoint, enforcing its rate limit
+        """
+        with self.lock:
+            self.requests += 1
+            if not self.limit:
+                return
+
+            url = '%s/%s.json' % (self.base_url, endpoint)
+            now = self.clock.time()
+            reset, remaining = self.windows.get(url, (0, self.limit))
+            if now >= reset:
+                reset, remaining = int(now) + self.window, self.limit
+            if remaining:
+                self.windows[url] = (reset, remaining - 1)
+            self.rate_limit.set_limit(url, self.limit,
+                                      max(0, remaining - 1), reset)
+
+            if not remaining:
+                self.rate_limited += 1
+                raise TwitterError([{'code': RATE_LIMIT_CODE,
+                                     'message': 'Rate limit exceeded'}])
+
+    def GetStatuses(self, status_ids, trim_user=False, include_entities=True,
+                    map=False):
+        """
+        Return the statuses of a list of IDs, as twitter.Api.GetStatuses:
+        a Dict of the statuses by ID (None for the missing ones) with map,
+        else the list of the statuses found. A request is made for each
+        MAX_LOOKUP_IDS IDs.
+        """
+        for _ in range(0, len(status_ids), MAX_LOOKUP_IDS):
+            self.request('statuses/lookup')
+        statuses = dict((int(x), self.statuses.get(int(x)))
+                        for x in status_ids)
+        if map:
+            return statuses
+        return [x for x in statuses.itervalues() if x is not None]
@@ -5,18 +5,31 @@ import os
 import sys
 import json
 import io
+import hashlib
 import twitter
 import argparse
 import logging
-import time
+import threading
 import twitter_nlp.python.twokenize as twk
 
+from collections import deque
+from multiprocessing.pool import ThreadPool
 from twitter.error import TwitterError
 from tqdm import tqdm
 from backports import csv
 
+from checkpoint import HydrationCheckpoint
+from fake_twitter_api import FakeTwitterApi, MAX_LOOKUP_IDS
+from hydration_cache import HydrationCache
+from rate_limiter import (RateLimiter, SimulatedClock, RETRY_CODES,
+                          TRANSPORT_ERRORS, error_code)
 from utils import import_config, set_log_config
 
+# Number of batches in flight or waiting to be written for each thread
+BATCHES_PER_WORKER = 2
+# Errors of the requests failed even after the retries, stopping the run
+REQUEST_ERRORS = (TwitterError,) + TRANSPORT_ERRORS
+
 
 class HydrateAnnotated(object):
     """
@@ -26,20 +39,79 @@ class HydrateAnnotated(object):
     2) INPUTFILE_summary.csv: file with information about tweets
     3) INPUTFILE__text_tkn.txt: file with tweet texts tokenized
 
+    The tweets are hydrated in batches of up to 100 IDs, with one lookup
+    request per batch. The IDs of the tweets which cannot be hydrated
+    (deleted, protected or not existing) are written in
+    INPUTFILE_missing.csv. When a request fails even after the retries,
+    the run stops, so that the tweets of the batch are requested again
+    with --resume.
+
+    The output files are flushed to disk and checkpointed periodically in
+    INPUTFILE_checkpoint.pkl. With --resume, a run stopped or crashed
+    continues from the last checkpoint, appending to the output files.
+
+    The requests are paced by a token-bucket RateLimiter for each
+    endpoint, synced with the rate limit headers of the responses: when
+    the rate limit is reached, it waits until the reset of the window.
+    The requests failed with a retriable error, or without a response
+    (connection failed or timed out), are retried with a bounded
+    exponential backoff.
+
+    With --workers the batches are hydrated by a pool of threads, sharing
+    the rate limiters, and the tweets are written out in the input order.
+
+    With --cache the tweets hydrated are stored in a SQLite database, and
+    the ones already there are not requested again, so that the data can
+    be pre-processed again offline. With --refresh-older-than the tweets
+    cached more than that number of days ago are requested again.
+
     Usage:
-    python hydrate_tweet.py -i ../path/to/input/file.json 
+    python hydrate_tweet.py -i ../path/to/input/file.json
+    [-b batch_size (int)]
+    [--workers N]
+    [--cache ../path/to/CACHE_FILE.sqlite]
+    [--refresh-older-than days (float)]
+    [--resume]
+    [--fake-api ../path/to/SUMMARY_FILE.csv]
+    [--fake-rate-limit requests (int)]
+
+    With --fake-api the tweets are hydrated offline from a summary file,
+    for testing without connecting to Twitter, on a simulated clock. With
+    --fake-rate-limit the fake API allows that number of requests per
+    window of each endpoint.
 
     """
-    def __init__(self, inpath):
+    def __init__(self, inpath, batch_size=None, fake_api=None,
+                 fake_rate_limit=None, workers=1, cache=None,
+                 refresh_older_than=None):
         """
         """
         self.cfg_tw_api = import_config('twitter_api')
         self.inpath = inpath
+        self.batch_size = min(
+            batch_size or self.cfg_tw_api['lookup_batch_size'],
+            MAX_LOOKUP_IDS)
+        self.fake_api = fake_api
+        self.fake_rate_limit = fake_rate_limit
+        self.workers = workers
+        self.clock = SimulatedClock() if fake_api else None
+        self.cache_path = cache
+        self.refresh_older_than = refresh_older_than
+        self.cache = None
 
     def connect_twitter_api(self):
         """
-        Connect to Twitter API
+        Connect to Twitter API, or to the fake one
         """
+        self.limiters = {}
+        self.limiters_lock = threading.Lock()
+        if self.fake_api:
+            self.api = FakeTwitterApi.from_summary(
+                self.fake_api, limit=self.fake_rate_limit,
+                window=self.cfg_tw_api['rate_limit_window'],
+                clock=self.clock)
+            return
+
         self.api = twitter.Api(consumer_key=self.cfg_tw_api[
                                                     'consumer_key'],
                                consumer_secret=self.cfg_tw_api[
@@ -51,118 +123,282 @@ class HydrateAnnotated(object):
                                cache=None,
                                tweet_mode='extended')
 
-    def hydrate_tweet(self, tweet_id):
+    def rate_limiter(self, endpoint):
+        """
+        Return the rate limiter of an endpoint, creating it if needed
         """
-        Hydrate Tweet from ID. Due to rate limit, when it is reached the
-        maximum number of request allowed it sleep for 5 minutes.
-        More information about the Twitter Policy of rate limiting
+        with self.limiters_lock:
+            if endpoint not in self.limiters:
+                self.limiters[endpoint] = RateLimiter(
+                    self.cfg_tw_api['rate_limit_requests'],
+                    self.cfg_tw_api['rate_limit_window'],
+                    self.cfg_tw_api['max_retries'],
+                    self.cfg_tw_api['max_backoff'],
+                    clock=self.clock)
+
+            return self.limiters[endpoint]
+
+    def request(self, endpoint, method, *args, **kwargs):
+        """
+        Make a request to an endpoint of the API when the rate limiter
+        allows it, retrying the failed requests with retriable errors or
+        transport errors (connection failed or timed out). The rate
+        limiter is updated from the headers of each response.
+        """
+        url = '%s/%s.json' % (self.api.base_url, endpoint)
+        limiter = self.rate_limiter(endpoint)
+        attempt = 0
+        while True:
+            limiter.acquire()
+            try:
+                result = method(*args, **kwargs)
+            except TwitterError, err:
+                limiter.update(self.api.rate_limit.get_limit(url))
+                if error_code(err) not in RETRY_CODES or \
+                        attempt == limiter.max_retries:
+                    raise
+            except TRANSPORT_ERRORS, err:
+                # No response, so no rate limit headers
+                if attempt == limiter.max_retries:
+                    raise
+            else:
+                limiter.update(self.api.rate_limit.get_limit(url))
+                return result
+
+            logging.error("Request to %s failed: %s" % (endpoint, err))
+            limiter.backoff(attempt)
+            attempt += 1
+
+    def hydrate_batch(self, tweet_ids):
+        """
+        Hydrate up to 100 tweets from their IDs with a single lookup
+        request, pacing the requests with the rate limit. It returns a
+        Dict of the statuses by integer tweet ID, with None for the tweets
+        which cannot be hydrated. When the request fails, its error is
+        raised, since the tweets of the batch are not known to be
+        missing. More information about the Twitter Policy of rate limiting
         https://developer.twitter.com/en/docs/basics/rate-limiting.html
         """
-        tweet_status = None
-        try:
-            tweet_status = self.api.GetStatus(tweet_id)
-        except TwitterError, err:
-            logging.error("Problem hydrating tweet ID %s: %s" % (
-                                            tweet_id, err))
+        return self.request('statuses/lookup', self.api.GetStatuses,
+                            [int(x) for x in tweet_ids], map=True)
 
-            if err.args[0][0]['code'] == 88:
-                logging.error('Waiting 5 minutes and then retrying...')
-                time.sleep(300)
-                self.hydrate_tweet(tweet_id)
+    def lookup_batch(self, tweet_ids):
+        """
+        Hydrate a batch of tweets, reading the ones cached from the cache
+        and storing there the ones requested. It returns a Dict of the
+        statuses by integer tweet ID, as hydrate_batch.
+        """
+        if self.cache is None:
+            return self.hydrate_batch(tweet_ids)
 
-        return tweet_status
+        statuses = self.cache.get(tweet_ids)
+        uncached = [x for x in tweet_ids if int(x) not in statuses]
+        if uncached:
+            hydrated = self.hydrate_batch(uncached)
+            self.cache.put(hydrated)
+            statuses.update(hydrated)
 
-    def run(self, tweets):
+        return statuses
+
+    def hydrated_batches(self, batches):
+        """
+        Yield each batch of tweets with its statuses, in the input order.
+        With workers, the batches are hydrated by a pool of threads: up to
+        BATCHES_PER_WORKER batches per thread are submitted ahead, and
+        their results are kept in a reorder buffer until the ones of all
+        the previous batches have been yielded.
+        """
+        if self.workers <= 1:
+            for batch in batches:
+                yield batch, self.lookup_batch(
+                    [tweet['tweet_id'] for tweet in batch])
+            return
+
+        pool = ThreadPool(self.workers)
+        pending = deque()
+        try:
+            for batch in batches:
+                if len(pending) == self.workers * BATCHES_PER_WORKER:
+                    done = pending.popleft()
+                    yield done[0], done[1].get()
+                pending.append((batch, pool.apply_async(
+                    self.lookup_batch,
+                    ([tweet['tweet_id'] for tweet in batch],))))
+            while pending:
+                done = pending.popleft()
+                yield done[0], done[1].get()
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def run(self, tweets, resume=False):
         """
         Given as input a list of tweets_id and related entities annotated,
         hydrate each tweet using the id and associate the entities information.
+        The output files are checkpointed every checkpoint_batches batches,
+        and with resume the run continues from the last checkpoint.
         """
         self.connect_twitter_api()
-
-        with io.open(self.cfg_tw_api['outfile_ent'] % self.inpath, 'w+',
+        if self.cache_path:
+            self.cache = HydrationCache(self.cache_path,
+                                        self.refresh_older_than)
+
+        checkpoint = HydrationCheckpoint(
+            self.cfg_tw_api['outfile_checkpoint'] % self.inpath,
+            {'tweets': hashlib.md5(json.dumps(tweets, sort_keys=True))
+             .hexdigest()})
+        resumed = resume and checkpoint.load()
+        if resumed:
+            checkpoint.truncate()
+        mode = 'a' if resumed else 'w+'
+
+        with io.open(self.cfg_tw_api['outfile_ent'] % self.inpath, mode,
                      newline='', encoding='utf-8') as csvfile,\
-             io.open(self.cfg_tw_api['outfile_info'] % self.inpath, 'w+',
+             io.open(self.cfg_tw_api['outfile_info'] % self.inpath, mode,
                      newline='', encoding='utf-8') as csvfile2,\
-             io.open(self.cfg_tw_api['outfile_text'] % self.inpath, 'w+',
-                     newline='', encoding='utf-8') as csvfile3:
+             io.open(self.cfg_tw_api['outfile_text'] % self.inpath, mode,
+                     newline='', encoding='utf-8') as csvfile3,\
+             io.open(self.cfg_tw_api['outfile_missing'] % self.inpath, mode,
+                     newline='', encoding='utf-8') as csvfile4:
 
             # Outfile Entities Check
             _writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
             # Outfile Summary
             _writer2 = csv.writer(csvfile2, quoting=csv.QUOTE_ALL)
+            # Outfile Missing
+            _writer4 = csv.writer(csvfile4, quoting=csv.QUOTE_ALL)
             # Write Headers
-            _writer.writerow(['TWEET_ID', 'ENT', 'I', 'E', 'IOB_TAG', 'TYPE'])
-            _writer2.writerow(['TWEET_ID', 'DATE', 'TEXT', 'ENT'])
+            if not resumed:
+                _writer.writerow(['TWEET_ID', 'ENT', 'I', 'E', 'IOB_TAG',
+                                  'TYPE'])
+                _writer2.writerow(['TWEET_ID', 'DATE', 'TEXT', 'ENT'])
+                _writer4.writerow(['TWEET_ID'])
+
+            index, missing = checkpoint.index, checkpoint.missing
+            progress = tqdm(total=len(tweets), initial=index)
+            batches = [tweets[n:n + self.batch_size]
+                       for n in range(index, len(tweets), self.batch_size)]
+            try:
+                for n, (batch, statuses) in enumerate(
+                        self.hydrated_batches(batches), 1):
+                    progress.update(len(batch))
+
+                    for tweet in batch:
+                        # Retrieve tweet info when possible, else skip
+                        tweet_status = statuses.get(int(tweet['tweet_id']))
+                        if not tweet_status:
+                            _writer4.writerow([unicode(tweet['tweet_id'])])
+                            missing += 1
+                            continue
 
-            for tweet in tqdm(tweets):
-                # Retrieve tweet info when possible, else skip
-                tweet_status = self.hydrate_tweet(tweet['tweet_id'])
-                if not tweet_status:
-                    continue
+                        self.write_tweet(_writer, _writer2, csvfile3, tweet,
+                                         tweet_status)
+
+                    index += len(batch)
+                    if not n % self.cfg_tw_api['checkpoint_batches'] or \
+                            index == len(tweets):
+                        checkpoint.save(index, missing, [csvfile, csvfile2,
+                                                         csvfile3, csvfile4])
+
+                    progress.set_postfix(**self.progress_stats(missing))
+            except REQUEST_ERRORS, err:
+                # The batches before the failed one have been written
+                checkpoint.save(index, missing, [csvfile, csvfile2,
+                                                 csvfile3, csvfile4])
+                progress.close()
+                logging.error("Problem hydrating the tweets from %d: %s. "
+                              "Run again with --resume to continue from "
+                              "there" % (index, err))
+                raise
+            progress.close()
+
+        if self.cache is not None:
+            self.cache.close()
+
+    def progress_stats(self, missing):
+        """
+        Return the statistics shown with the progress: tweets missing,
+        seconds waited for the rate limit and tweets read from the cache
+        """
+        stats = {'missing': str(missing),
+                 'waited': '%ds' % sum(x.waited
+                                       for x in self.limiters.itervalues())}
+        if self.cache is not None:
+            stats['cached'] = str(self.cache.hits)
+
+        return stats
 
-                # Replace line breaks in tweet text
-                tweet_text = tweet_status.full_text.replace('\n', ' ')
-                # Remove URLs from text
-                tweet_text = " ".join(filter(
-                                      lambda x: x[0:4] != 'http',
-                                      tweet_text.split()))
+    def write_tweet(self, _writer, _writer2, csvfile3, tweet, tweet_status):
+        """
+        Write out the summary, the text tokenized and the entities
+        annotated of a tweet hydrated
+        """
+        # Replace line breaks in tweet text
+        tweet_text = tweet_status.full_text.replace('\n', ' ')
+        # Remove URLs from text
+        tweet_text = " ".join(filter(
+                              lambda x: x[0:4] != 'http',
+                              tweet_text.split()))
 
-                # Summary file row
-                row = [tweet['tweet_id'], tweet_status.created_at, tweet_text
-                       ] + tweet['entities']
+        # Summary file row
+        row = [tweet['tweet_id'], tweet_status.created_at, tweet_text
+               ] + tweet['entities']
 
-                try:
-                    _writer2.writerow(row)
-                except Exception, ex:
-                    logging.error(ex)
+        try:
+            _writer2.writerow(row)
+        except Exception, ex:
+            logging.error(ex)
 
-                # Write out tweet text tokenized
+        # Write out tweet text tokenized
+        try:
+            csvfile3.write(' '.join(
+                [x for x in twk.tokenize(tweet_text)])+"\n")
+        except Exception, ex:
+            logging.error(ex)
+
+        # Check Entity annotations
+        if tweet['entities']:
+            for entity in tweet['entities']:
                 try:
-                    csvfile3.write(' '.join(
-                        [x for x in twk.tokenize(tweet_text)])+"\n")
-                except Exception, ex:
-                    logging.error(ex)
-
-                # Check Entity annotations
-                if tweet['entities']:
-                    for entity in tweet['entities']:
-                        try:
-                            i, e, t = entity.split(',')
-                        except ValueError, er:
-                            print("Problem with tweet ID"
-                                  "%d" % tweet['tweet_id'])
-                            print(er)
-                            sys.exit()
-
-                        i, e = int(i), int(e)
-
-                        # Check Entity types
-                        if t not in ['Contributor', 'Work']:
-                            logging.error('Entity not allowed: %s' % t)
-                            continue
-                        entity = tweet_status.full_text[i:e]
-
-                        # Add IOB tags
-                        start = True
-                        for token in entity.split():
-                            if start:
-                                iob_tag = 'B'
-                                start = False
-                            else:
-                                iob_tag = 'I'
-                            ent_token = tweet_status.full_text[i:i+len(token)]
-
-                            # Write out Entity annotated
-                            row = [unicode(tweet['tweet_id']),
-                                   ent_token, i, i + len(token),
-                                   iob_tag, t]
-                            try:
-                                _writer.writerow(row)
-                            except Exception, ex:
-                                logging.error(ex)
-
-                            # Update index
-                            i = i + len(token) + 1
+                    i, e, t = entity.split(',')
+                except ValueError, er:
+                    print("Problem with tweet ID"
+                          "%d" % tweet['tweet_id'])
+                    print(er)
+                    sys.exit()
+
+                i, e = int(i), int(e)
+
+                # Check Entity types
+                if t not in ['Contributor', 'Work']:
+                    logging.error('Entity not allowed: %s' % t)
+                    continue
+                entity = tweet_status.full_text[i:e]
+
+                # Add IOB tags
+                start = True
+                for token in entity.split():
+                    if start:
+                        iob_tag = 'B'
+                        start = False
+                    else:
+                        iob_tag = 'I'
+                    ent_token = tweet_status.full_text[i:i+len(token)]
+
+                    # Write out Entity annotated
+                    row = [unicode(tweet['tweet_id']),
+                           ent_token, i, i + len(token),
+                           iob_tag, t]
+                    try:
+                        _writer.writerow(row)
+                    except Exception, ex:
+                        logging.error(ex)
+
+                    # Update index
+                    i = i + len(token) + 1
 
 
 def arg_parser():
@@ -173,6 +409,27 @@ def arg_parser():
                         help="Input file path")
     parser.add_argument("-l", "--logfile", type=str,
                         help="Log file path")
+    parser.add_argument("-b", "--batch-size", type=int, dest='batch_size',
+                        help="Number of tweets hydrated with each lookup "
+                             "request (at most 100)")
+    parser.add_argument("--fake-api", type=str, dest='fake_api',
+                        help="Summary file whose tweets are returned by a "
+                             "fake Twitter API, for testing offline")
+    parser.add_argument("--fake-rate-limit", type=int,
+                        dest='fake_rate_limit',
+                        help="Requests allowed by the fake Twitter API per "
+                             "rate limit window")
+    parser.add_argument("-j", "--workers", type=int, dest='workers',
+                        default=1,
+                        help="Number of threads hydrating the tweets")
+    parser.add_argument("--cache", type=str,
+                        help="SQLite file caching the tweets hydrated")
+    parser.add_argument("--refresh-older-than", type=float,
+                        dest='refresh_older_than',
+                        help="Request again the tweets cached more than "
+                             "this number of days ago")
+    parser.add_argument("--resume", action='store_true',
+                        help="Resume the run from the last checkpoint")
     args = parser.parse_args()
 
     return args
@@ -202,7 +459,12 @@ if __name__ == '__main__':
         sys.exit()
 
     if tweets_annotated:
-        ha = HydrateAnnotated(inpath)
-        ha.run(tweets_annotated)
+        ha = HydrateAnnotated(inpath, args.batch_size, args.fake_api,
+                              args.fake_rate_limit, args.workers, args.cache,
+                              args.refresh_older_than)
+        try:
+            ha.run(tweets_annotated, args.resume)
+        except REQUEST_ERRORS:
+            sys.exit(1)
     else:
         logging.error("No tweets annotated found")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import json
+import logging
+import sqlite3
+import threading
+
+from twitter import Status
+
+from rate_limiter import Clock
+
+# Seconds in a day
+DAY = 86400
+
+
+class HydrationCache(object):
+    """
+    Persistent cache of the hydrated tweets, in a SQLite database keyed
+    by tweet ID. It stores the JSON of the status of each tweet, or NULL
+    for the tweets which could not be hydrated, with the time it was
+    fetched. With max_age (in days), the tweets fetched before are not
+    returned, so that they are fetched again.
+
+    It is thread-safe, so that it can be shared by the hydration threads.
+    """
+    def __init__(self, path, max_age=None, clock=None):
+        """
+        """
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock or Clock()
+        self.lock = threading.Lock()
+        self.hits = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS statuses ("
+                          "tweet_id INTEGER PRIMARY KEY, "
+                          "status TEXT, "
+                          "fetched_at REAL NOT NULL)")
+        self.conn.commit()
+
+    def get(self, tweet_ids):
+        """
+        Return a Dict of the statuses cached by integer tweet ID (None for
+        the tweets which could not be hydrated), only for the tweets in
+        the cache and not older than max_age
+        """
+        oldest = 0
+        if self.max_age is not None:
+            oldest = self.clock.time() - self.max_age*DAY
+
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT tweet_id, status FROM statuses WHERE fetched_at >= ? "
+                "AND tweet_id IN (%s)" % ','.join('?' * len(tweet_ids)),
+                [oldest] + [int(x) for x in tweet_ids]).fetchall()
+            self.hits += len(rows)
+
+        return dict((tweet_id, Status.NewFromJsonDict(json.loads(status))
+                     if status is not None else None)
+                    for tweet_id, status in rows)
+
+    def put(self, statuses):
+        """
+        Store a Dict of the statuses fetched by integer tweet ID (None for
+        the tweets which could not be hydrated)
+        """
+        fetched_at = self.clock.time()
+        rows = [(tweet_id, status.AsJsonString() if status is not None
+                 else None, fetched_at)
+                for tweet_id, status in statuses.iteritems()]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO statuses "
+                                  "VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+
+    def close(self):
+        """
+        """
+        logging.info("%d tweets read from the cache %s", self.hits,
+                     self.path)
+        self.conn.close()
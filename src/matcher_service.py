@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import io
+import os
+import sys
+import json
+import time
+import socket
+import select
+import argparse
+import logging
+
+from bisect import insort, bisect_left, bisect_right
+from collections import deque
+
+from schedule_index import format_epoch
+from schedule_matcher import ScheduleMatcher
+from utils import set_log_config
+
+
+class LineReader(object):
+    """
+    Split in lines the data read from a file descriptor or a socket
+    """
+    def __init__(self, read, kind=None):
+        """
+        """
+        self.read = read
+        self.kind = kind
+        self.buffer = ''
+
+    def read_lines(self):
+        """
+        Read the data available and return the complete lines, or None
+        when the stream is closed
+        """
+        data = self.read(65536)
+        if not data:
+            return None
+
+        lines = (self.buffer + data).split('\n')
+        self.buffer = lines.pop()
+        return lines
+
+
+class ScheduleMatcherService(object):
+    """
+    Long-running schedule matcher, fed by a live stream of schedule tweets
+    and a live stream of user-generated tweets, in JSON lines. Each message
+    has the fields of the summary files: id, created_at, text and entities
+    (list of 'start,end,type'). On the standard input the two streams are
+    mixed, and each message has also the field stream ('schedule' or
+    'ugc'). Otherwise the two streams are read from two local sockets.
+
+    A UG tweet is matched once the schedule stream has passed its time
+    window, or after waiting max_delay seconds. The results are written
+    in CoNLL or JSON format. Only the schedule tweets which can still be
+    in the window of a UG tweet are kept: the ones older than the
+    watermark (the latest date received) minus max_lateness and time_tsl
+    are evicted, so memory stays flat over time: the tokens of their
+    entities are freed from the vocabulary once no schedule tweet in the
+    window references them.
+
+    Usage:
+    python matcher_service.py
+    -w work_tsl (float)
+    -c contr_tsl (float)
+    -t time_tsl (int)
+    [-f conll|json] [-d max_delay] [-m max_lateness]
+    [--schedule-socket ../path/to/schedule.sock
+     --ugc-socket ../path/to/ugc.sock]
+
+    """
+    def __init__(self, work_tsl, contr_tsl, time_tsl, out_format='conll',
+                 max_delay=60, max_lateness=0, outf=None):
+        """
+        """
+        # The matcher reads the schedule window from DictSched, which is
+        # kept updated by the service
+        self.matcher = ScheduleMatcher(None, None, None, work_tsl,
+                                       contr_tsl, time_tsl,
+                                       streaming_join=True)
+        self.time_tsl = time_tsl
+        self.out_format = out_format
+        self.max_delay = max_delay
+        self.max_lateness = max_lateness
+        self.outf = outf or io.open(sys.stdout.fileno(), 'w',
+                                    encoding='utf-8', closefd=False)
+
+        # Schedule tweets sorted by date, as (epoch, arrival count, ID)
+        self.sched_dates = []
+        self.sched_count = 0
+        # UG tweets waiting for the schedule, as (arrival time, ID, tweet)
+        self.pending = deque()
+        # Latest date received on each stream
+        self.sched_watermark = None
+        self.ugc_watermark = None
+
+    def add_message(self, message, kind=None):
+        """
+        Add a message received from one of the two streams
+        """
+        kind = kind or message.get('stream')
+        row = [unicode(message['id']), message['created_at'],
+               message['text']] + list(message.get('entities', []))
+
+        if kind == 'schedule':
+            self.add_schedule(row)
+        elif kind == 'ugc':
+            self.add_ugc(row)
+        else:
+            logging.error("Unknown stream of message %s", message['id'])
+
+    def add_schedule(self, row):
+        """
+        Add a schedule tweet to the window
+        """
+        sch_tweet_id, sch_tweet = self.matcher.schedule_tweet(row)
+        epoch = sch_tweet.created_at
+        token_ids = self.matcher.token_ids(sch_tweet)
+        # The tokens of the window are referenced by its schedule tweets
+        self.matcher.vocab.retain(token_ids)
+        if sch_tweet_id in self.matcher.DictSched:
+            logging.warning("Duplicate schedule tweet %s", sch_tweet_id)
+            # Free the tokens interned only for the duplicate
+            self.matcher.vocab.release(token_ids)
+            return
+
+        self.sched_count += 1
+        insort(self.sched_dates, (epoch, self.sched_count, sch_tweet_id))
+        self.matcher.DictSched[sch_tweet_id] = sch_tweet
+        self.sched_watermark = max(epoch, self.sched_watermark)
+
+    def add_ugc(self, row):
+        """
+        Add a UG tweet to the ones waiting for the schedule
+        """
+        tweet_id, tweet = self.matcher.ugc_tweet(row)
+        self.pending.append((time.time(), tweet_id, tweet))
+        self.ugc_watermark = max(tweet.created_at, self.ugc_watermark)
+
+    def window(self, epoch):
+        """
+        Return the IDs of the schedule tweets in the time window of epoch
+        """
+        lo = bisect_right(self.sched_dates,
+                          (epoch - self.time_tsl, sys.maxint))
+        hi = bisect_left(self.sched_dates, (epoch + self.time_tsl, 0), lo)
+        return [x[2] for x in self.sched_dates[lo:hi]]
+
+    def flush(self, force=False):
+        """
+        Match and write out the UG tweets whose time window has been passed
+        by the schedule stream, or which waited max_delay seconds. With
+        force all the pending UG tweets are written out.
+        """
+        now = time.time()
+        while self.pending:
+            arrival, tweet_id, tweet = self.pending[0]
+            ready = (self.sched_watermark is not None and
+                     self.sched_watermark >= tweet.created_at +
+                     self.time_tsl)
+            if not (force or ready or now - arrival >= self.max_delay):
+                break
+
+            self.pending.popleft()
+            self.emit(tweet_id, tweet)
+
+        self.evict()
+
+    def emit(self, tweet_id, tweet):
+        """
+        Match a UG tweet against the schedule window and write out the
+        results
+        """
+        if self.out_format == 'json':
+            (tweet_text_tokens, tweet_ent_split, entities_token_matched,
+                matched_sch_ids, _) = self.matcher.find_matches(
+                    tweet, self.window(tweet.created_at))
+            result = {
+                'id': tweet_id,
+                'created_at': format_epoch(tweet.created_at),
+                'tokens': list(self.matcher.conll_lines(
+                    tweet_text_tokens, tweet_ent_split,
+                    entities_token_matched)),
+                'schedule_ids': sorted(set(matched_sch_ids))}
+            self.outf.write(unicode(json.dumps(result)) + u'\n')
+        else:
+            self.matcher.match_tweet(self.outf, tweet_id, tweet,
+                                     self.window(tweet.created_at))
+        self.outf.flush()
+
+    def evict(self):
+        """
+        Remove the schedule tweets which cannot be in the time window of
+        the pending and of the next UG tweets
+        """
+        watermark = max(self.sched_watermark, self.ugc_watermark)
+        if watermark is None:
+            return
+
+        horizon = watermark - self.max_lateness
+        if self.pending:
+            horizon = min(horizon, min(x[2].created_at
+                                       for x in self.pending))
+        horizon -= self.time_tsl
+
+        evicted = bisect_right(self.sched_dates, (horizon, sys.maxint))
+        freed = []
+        for _, _, sch_tweet_id in self.sched_dates[:evicted]:
+            freed += self.matcher.vocab.release(self.matcher.token_ids(
+                self.matcher.DictSched.pop(sch_tweet_id)))
+        del self.sched_dates[:evicted]
+
+        # Once the similarity cache is full, the pairs of the tokens freed
+        # are removed, so that it keeps caching the pairs of the window
+        sim_cache = self.matcher.sim_cache
+        if freed and len(sim_cache) >= sim_cache.max_size:
+            sim_cache.prune(lambda x: x in self.matcher.vocab.ids)
+
+    def handle_lines(self, lines, kind=None):
+        """
+        Parse and add the JSON lines received
+        """
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                self.add_message(json.loads(line), kind)
+            except (ValueError, KeyError), err:
+                logging.error("Invalid message: %s", err)
+
+    def serve_stdin(self):
+        """
+        Read the two streams mixed on the standard input, until it is
+        closed
+        """
+        reader = LineReader(lambda n: os.read(sys.stdin.fileno(), n))
+        while True:
+            readable, _, _ = select.select([sys.stdin], [], [],
+                                           self.max_delay)
+            if readable:
+                lines = reader.read_lines()
+                if lines is None:
+                    break
+                self.handle_lines(lines)
+            self.flush()
+
+        self.handle_lines([reader.buffer])
+        self.flush(force=True)
+
+    def serve_sockets(self, sched_path, ugc_path):
+        """
+        Listen for the two streams on two local sockets, until interrupted
+        """
+        listeners = {}
+        for kind, path in (('schedule', sched_path), ('ugc', ugc_path)):
+            if os.path.exists(path):
+                os.unlink(path)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(path)
+            listener.listen(5)
+            listeners[listener] = kind
+            logging.info("Listening for %s tweets on %s", kind, path)
+
+        readers = {}
+        try:
+            while True:
+                readable, _, _ = select.select(
+                    list(listeners) + list(readers), [], [], self.max_delay)
+                for sock in readable:
+                    if sock in listeners:
+                        conn, _ = sock.accept()
+                        readers[conn] = LineReader(conn.recv, listeners[sock])
+                        continue
+
+                    reader = readers[sock]
+                    lines = reader.read_lines()
+                    if lines is None:
+                        self.handle_lines([reader.buffer], reader.kind)
+                        del readers[sock]
+                        sock.close()
+                    else:
+                        self.handle_lines(lines, reader.kind)
+                self.flush()
+        except KeyboardInterrupt:
+            logging.info("Interrupted, writing out the pending tweets...")
+        finally:
+            self.flush(force=True)
+            for sock in list(listeners) + list(readers):
+                sock.close()
+            for path in (sched_path, ugc_path):
+                os.unlink(path)
+
+
+def arg_parser():
+    """
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-w", "--work-tsl", type=float, dest='work_tsl',
+                        help="Work threshold for matching")
+    parser.add_argument("-c", "--contr-tsl", type=float, dest='contr_tsl',
+                        help="Contributor threshold for matching")
+    parser.add_argument("-t", "--time-tsl", type=int, dest='time_tsl',
+                        help="Time-distance threshold for matching")
+    parser.add_argument("-f", "--format", type=str, dest='out_format',
+                        choices=['conll', 'json'], default='conll',
+                        help="Output format")
+    parser.add_argument("-d", "--max-delay", type=float, dest='max_delay',
+                        default=60,
+                        help="Max seconds a UG tweet waits for the schedule")
+    parser.add_argument("-m", "--max-lateness", type=int,
+                        dest='max_lateness', default=0,
+                        help="Max seconds a UG tweet can arrive out of order")
+    parser.add_argument("--schedule-socket", type=str, dest='sched_socket',
+                        help="Local socket for the schedule stream")
+    parser.add_argument("--ugc-socket", type=str, dest='ugc_socket',
+                        help="Local socket for the UG tweets stream")
+    parser.add_argument("-l", "--logfile", type=str, help="Log file path")
+
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+
+    args = arg_parser()
+    set_log_config(args.logfile, logging.INFO)
+
+    if bool(args.sched_socket) != bool(args.ugc_socket):
+        logging.error("Please insert both options --schedule-socket and "
+                      "--ugc-socket")
+        sys.exit()
+
+    service = ScheduleMatcherService(args.work_tsl,
+                                     args.contr_tsl,
+                                     args.time_tsl,
+                                     args.out_format,
+                                     args.max_delay,
+                                     args.max_lateness)
+    if args.sched_socket:
+        service.serve_sockets(args.sched_socket, args.ugc_socket)
+    else:
+        service.serve_stdin()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import io
+import json
+import cProfile
+import logging
+
+from collections import defaultdict
+from timeit import default_timer
+
+
+class Stage(object):
+    """
+    Timer of a stage, used as context manager
+    """
+    def __init__(self, times, name):
+        """
+        """
+        self.times = times
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = default_timer()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.times[self.name] += default_timer() - self.start
+
+
+class NullStage(object):
+    """
+    Stage of a disabled profiler, which does not time anything
+    """
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class StageProfiler(object):
+    """
+    Opt-in instrumentation of a run: wall-clock time spent in each stage
+    and counters. The time of a stage includes the one of the stages nested
+    in it. When disabled, stages and counters cost a single check. The
+    hot loop of the run can also be profiled with cProfile, writing the
+    stats in stats_file (to be read with pstats).
+    """
+    def __init__(self, enabled=False, stats_file=None):
+        """
+        """
+        self.enabled = enabled
+        self.stats_file = stats_file
+        self.times = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.cprofile = None
+
+    def stage(self, name):
+        """
+        Return the timer of a stage
+        """
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self.times, name)
+
+    def count(self, name, value=1):
+        """
+        Increment a counter
+        """
+        if self.enabled:
+            self.counters[name] += value
+
+    def start_hot_loop(self):
+        """
+        Start profiling the hot loop with cProfile, if requested
+        """
+        if self.stats_file:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def stop_hot_loop(self):
+        """
+        Stop profiling the hot loop, and write the stats
+        """
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.stats_file)
+            self.cprofile = None
+            logging.info("Profile stats written in %s", self.stats_file)
+
+    def stats(self):
+        """
+        Return the times and counters, to be added to another profiler
+        """
+        return dict(self.times), dict(self.counters)
+
+    def update(self, stats):
+        """
+        Add the times and counters of another profiler, e.g. of a worker
+        """
+        times, counters = stats
+        for name in times:
+            self.times[name] += times[name]
+        for name in counters:
+            self.counters[name] += counters[name]
+
+    def report(self, **info):
+        """
+        Return the times and counters in a Dict, together with info
+        """
+        report = dict(info)
+        report['stages'] = dict(
+            (name, round(seconds, 6)) for name, seconds in self.times.items())
+        report['counters'] = dict(self.counters)
+        return report
+
+    def dump(self, outfile, **info):
+        """
+        Write the report in JSON
+        """
+        with io.open(outfile, 'w+', encoding='utf-8') as outf:
+            outf.write(unicode(json.dumps(self.report(**info), indent=2,
+                                          sort_keys=True)))
+        logging.info("Profile written in %s", outfile)
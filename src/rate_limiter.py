@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import time
+import logging
+import requests
+import threading
+
+# Error code of the rate limit reached
+RATE_LIMIT_CODE = 88
+# Error codes of the requests which can be retried: rate limit reached,
+# over capacity and internal error
+RETRY_CODES = (RATE_LIMIT_CODE, 130, 131)
+# Transport errors of the requests which can be retried: connection
+# failed or timed out, without a response
+TRANSPORT_ERRORS = (requests.ConnectionError, requests.Timeout)
+# Seconds waited after the reset time of the server, against clock skew
+RESET_MARGIN = 1
+
+
+def error_code(err):
+    """
+    Return the code of a TwitterError, if any
+    """
+    try:
+        return err.args[0][0]['code']
+    except (IndexError, KeyError, TypeError):
+        return None
+
+
+class Clock(object):
+    """
+    Wall clock, in epoch seconds
+    """
+    def time(self):
+        """
+        """
+        return time.time()
+
+    def sleep(self, seconds):
+        """
+        """
+        time.sleep(seconds)
+
+    def wait(self, condition, seconds):
+        """
+        Wait on a condition, releasing its lock, until it is notified or
+        for the seconds given
+        """
+        condition.wait(seconds)
+
+
+class SimulatedClock(Clock):
+    """
+    Clock whose time only advances when sleeping, for testing the rate
+    limiter without waiting
+    """
+    def __init__(self, now=None):
+        """
+        """
+        self.now = time.time() if now is None else now
+
+    def time(self):
+        """
+        """
+        return self.now
+
+    def sleep(self, seconds):
+        """
+        """
+        self.now += seconds
+
+    def wait(self, condition, seconds):
+        """
+        """
+        self.now += seconds
+
+
+class RateLimiter(object):
+    """
+    Token-bucket scheduler of the requests to a Twitter API endpoint,
+    which allows limit requests per window of seconds. The bucket holds
+    up to limit tokens, refilled at limit/window tokens per second, and
+    each request takes a token, waiting for it only as long as needed.
+
+    The bucket is kept in sync with the rate limit headers of the
+    responses (limit, remaining requests and reset time of the window):
+    when no requests are remaining it waits until the reset time, when
+    the bucket is full again. The requests failed with a retriable error
+    are retried with an exponential backoff, bounded by max_backoff
+    seconds, up to max_retries times.
+
+    It is thread-safe, so that a single rate limiter paces the requests
+    of all the hydration threads. The threads waiting for a token do not
+    hold the lock, so that the responses of the other threads can update
+    the rate limit meanwhile, waking them up to check it again.
+    """
+    def __init__(self, limit, window, max_retries, max_backoff,
+                 clock=None):
+        """
+        """
+        self.clock = clock or Clock()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.window = float(window)
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.set_rate(limit)
+
+        self.tokens = float(limit)
+        self.updated = self.clock.time()
+        # Remaining requests and reset time of the window of the server,
+        # when known from the headers
+        self.remaining = None
+        self.reset = None
+        # Seconds waited so far
+        self.waited = 0.0
+
+    def set_rate(self, limit):
+        """
+        Set the capacity and refill rate of the bucket
+        """
+        self.limit = limit
+        self.rate = limit / self.window
+
+    def refill(self):
+        """
+        Add the tokens gained since the last update. When the window of
+        the server is over, the bucket is full again.
+        """
+        now = self.clock.time()
+        self.tokens = min(float(self.limit),
+                          self.tokens + (now - self.updated)*self.rate)
+        self.updated = now
+        if self.reset is not None and now >= self.reset:
+            self.tokens = float(self.limit)
+            self.remaining = None
+            self.reset = None
+
+    def exhausted(self):
+        """
+        Check if no requests are remaining in the window of the server
+        """
+        return self.remaining is not None and self.remaining < 1
+
+    def wait_time(self):
+        """
+        Return the seconds to wait for a token
+        """
+        self.refill()
+        if self.exhausted():
+            return self.reset - self.clock.time()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def sleep(self, seconds):
+        """
+        """
+        with self.lock:
+            self.waited += seconds
+        self.clock.sleep(seconds)
+
+    def acquire(self):
+        """
+        Wait until a request can be made, and take a token for it. The
+        lock is released while waiting, and the wait is computed again
+        whenever the rate limit is updated.
+        """
+        with self.lock:
+            wait = self.wait_time()
+            while wait > 0:
+                start = self.clock.time()
+                self.clock.wait(self.changed, wait)
+                self.waited += self.clock.time() - start
+                wait = self.wait_time()
+            self.tokens -= 1
+            if self.remaining is not None:
+                self.remaining -= 1
+
+    def update(self, rate_limit):
+        """
+        Sync the bucket with the rate limit of the endpoint read from the
+        headers of the last response (an EndpointRateLimit). A rate limit
+        without reset time has not been read from headers and is ignored.
+        """
+        limit, remaining, reset = rate_limit
+        if not reset:
+            return
+
+        with self.lock:
+            self.refill()
+            if limit and limit != self.limit:
+                self.set_rate(limit)
+                self.tokens = min(self.tokens, float(limit))
+            if reset + RESET_MARGIN > self.clock.time():
+                self.remaining = remaining
+                self.reset = reset + RESET_MARGIN
+            self.changed.notify_all()
+
+    def backoff(self, attempt):
+        """
+        Wait before retrying a failed request: until the reset time if
+        no requests are remaining, else for an exponential backoff
+        """
+        with self.lock:
+            if self.exhausted():
+                logging.error('Waiting %d seconds for the rate limit '
+                              'reset...' % (self.reset - self.clock.time()))
+                return
+
+        wait = min(self.max_backoff, 2 ** attempt)
+        logging.error('Waiting %d seconds and then retrying...' % wait)
+        self.sleep(wait)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import time
+import math
+import json
+import mmap
+import struct
+import marshal
+import calendar
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from dateutil.parser import parse
+
+MONTHS = dict((month, i) for i, month in enumerate(calendar.month_abbr) if i)
+
+# Compiled schedule file format
+INDEX_MAGIC = 'SCHEDIDX'
+INDEX_VERSION = 2
+INDEX_HEADER = struct.Struct('<8sI')
+
+# Schedule entity normalized at import: IDs of the lowercased tokens, mask
+# of the tokens to be matched (neither stopwords nor punctuation), type,
+# type ID and number of tokens
+ScheduleEntity = namedtuple('ScheduleEntity', ['tokens', 'mask', 'etype',
+                                               'etype_id', 'size'])
+# Schedule tweet: creation date in epoch seconds, text and entities
+ScheduleTweet = namedtuple('ScheduleTweet', ['created_at', 'text',
+                                             'entities'])
+
+
+def parse_epoch(created_at):
+    """
+    Parse a date to integer seconds since the Unix epoch. Dates in the
+    Twitter created_at format (e.g. 'Wed Oct 10 20:19:24 +0000 2018') are
+    parsed with a fast path, the others with dateutil
+    """
+    fields = created_at.split()
+    if len(fields) == 6 and fields[1] in MONTHS:
+        try:
+            hour, minute, second = fields[3].split(':')
+            offset = int(fields[4])
+            epoch = calendar.timegm((int(fields[5]), MONTHS[fields[1]],
+                                     int(fields[2]), int(hour), int(minute),
+                                     int(second)))
+            sign = -1 if offset < 0 else 1
+            offset = abs(offset)
+            return epoch - sign*((offset // 100)*3600 + (offset % 100)*60)
+        except ValueError:
+            pass
+
+    return int(math.floor(to_epoch(parse(created_at))))
+
+
+def format_epoch(epoch):
+    """
+    Format seconds since the Unix epoch as a UTC date
+    """
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+
+
+def to_epoch(date):
+    """
+    Convert a datetime to seconds since the Unix epoch. Naive datetimes
+    are considered in UTC
+    """
+    if date.utcoffset() is not None:
+        date_tuple = date.utctimetuple()
+    else:
+        date_tuple = date.timetuple()
+    return calendar.timegm(date_tuple) + date.microsecond / 1e6
+
+
+class ScheduleTimeIndex(object):
+    """
+    It keeps the schedule tweets IDs sorted by creation date (in epoch
+    seconds) in parallel arrays, so that the schedule tweets inside a time
+    window around an user-generated tweet are retrieved with a binary
+    search instead of scanning the whole schedule.
+    """
+    def __init__(self, DictSched):
+        """
+        """
+        # Position of each schedule tweet in the Dict iteration order,
+        # used for returning the window in the same order of a full scan
+        order = dict((sch_id, n) for n, sch_id in enumerate(DictSched))
+
+        entries = sorted(
+            (DictSched[sch_id].created_at, order[sch_id], sch_id)
+            for sch_id in DictSched)
+
+        self.epochs = [x[0] for x in entries]
+        self.ranks = [x[1] for x in entries]
+        self.ids = [x[2] for x in entries]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def window(self, epoch, time_tsl):
+        """
+        Return the IDs of the schedule tweets whose time distance from
+        epoch is lower than time_tsl, in the schedule Dict order
+        """
+        lo = bisect_right(self.epochs, epoch - time_tsl)
+        hi = bisect_left(self.epochs, epoch + time_tsl, lo)
+
+        return [sch_id for _, sch_id in sorted(
+            zip(self.ranks[lo:hi], self.ids[lo:hi]))]
+
+
+def index_key(schedule_file, stopwords_file, limit):
+    """
+    Key of a compiled schedule: size and modification time of the files it
+    is compiled from, and the limit of schedule tweets imported
+    """
+    key = {'limit': limit}
+    for name, path in (('schedule', schedule_file),
+                       ('stopwords', stopwords_file)):
+        stat = os.stat(path)
+        key[name] = [stat.st_size, repr(stat.st_mtime)]
+
+    return key
+
+
+def compile_schedule(DictSched, vocab, path, key):
+    """
+    Write the schedule tweets in a binary file, which is opened with
+    CompiledSchedule. The tweets are sorted by creation date, keeping their
+    position in the Dict iteration order. The tokens of the entities are
+    stored as IDs of the TokenVocabulary vocab, which is written too, and
+    the types are interned as integer IDs.
+    """
+    order = dict((sch_id, n) for n, sch_id in enumerate(DictSched))
+    entries = sorted(
+        (DictSched[sch_id].created_at, order[sch_id], sch_id)
+        for sch_id in DictSched)
+
+    types = {}
+    epochs, ranks = array('l'), array('l')
+    ids, id_offsets = [], array('l', [0])
+    records, record_offsets = [], array('l', [0])
+    for epoch, rank, sch_id in entries:
+        sch_tweet = DictSched[sch_id]
+        entities = tuple(
+            (e.tokens.tostring(), e.mask,
+             types.setdefault(e.etype, len(types)), e.etype_id)
+            for e in sch_tweet.entities)
+        record = marshal.dumps((sch_tweet.text, entities))
+
+        epochs.append(epoch)
+        ranks.append(rank)
+        ids.append(sch_id.encode('utf-8'))
+        id_offsets.append(id_offsets[-1] + len(ids[-1]))
+        records.append(record)
+        record_offsets.append(record_offsets[-1] + len(record))
+
+    sections = [
+        ('epochs', epochs.tostring()),
+        ('ranks', ranks.tostring()),
+        ('id_offsets', id_offsets.tostring()),
+        ('ids', ''.join(ids)),
+        ('record_offsets', record_offsets.tostring()),
+        ('records', ''.join(records)),
+        ('vocab', marshal.dumps(vocab.tokens))]
+
+    header = {'version': INDEX_VERSION,
+              'key': key,
+              'count': len(entries),
+              'itemsize': epochs.itemsize,
+              'token_itemsize': array('i').itemsize,
+              'types': sorted(types, key=types.get),
+              'sections': {}}
+    offset = 0
+    for name, data in sections:
+        header['sections'][name] = [offset, len(data)]
+        offset += len(data)
+    header = json.dumps(header)
+
+    # Written in a temporary file first, so that a broken index is never
+    # opened
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as outf:
+        outf.write(INDEX_HEADER.pack(INDEX_MAGIC, len(header)))
+        outf.write(header)
+        for _, data in sections:
+            outf.write(data)
+    os.rename(tmp_path, path)
+
+
+def open_compiled_schedule(path, key):
+    """
+    Open a compiled schedule. It returns None if the file does not exist,
+    or if it was compiled from different files
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as inf:
+        magic, header_size = INDEX_HEADER.unpack(
+            inf.read(INDEX_HEADER.size))
+        if magic != INDEX_MAGIC:
+            return None
+        header = json.loads(inf.read(header_size))
+        if (header['version'] != INDEX_VERSION or header['key'] != key or
+                header['itemsize'] != array('l').itemsize or
+                header['token_itemsize'] != array('i').itemsize):
+            return None
+
+        return CompiledSchedule(inf, header, INDEX_HEADER.size + header_size)
+
+
+class CompiledSchedule(object):
+    """
+    Schedule compiled by compile_schedule, and mapped in memory. It is
+    used both as the schedule Dict, decoding the schedule tweets when they
+    are accessed, and as the ScheduleTimeIndex, with the same window. The
+    entities tokens are IDs of the tokens in vocab, which is used for
+    the matcher TokenVocabulary.
+    """
+    def __init__(self, inf, header, base):
+        """
+        """
+        self.mm = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+        self.base = base
+        self.sections = header['sections']
+        self.count = header['count']
+        self.types = header['types']
+
+        self.epochs = self.array('epochs')
+        self.ranks = self.array('ranks')
+        self.id_offsets = self.array('id_offsets')
+        self.record_offsets = self.array('record_offsets')
+        self.vocab = marshal.loads(self.section('vocab'))
+
+        # Positions of the schedule tweets IDs looked up so far
+        self.positions = {}
+
+    def section(self, name, start=0, end=None):
+        """
+        Read a section of the file, or a slice of it
+        """
+        offset, size = self.sections[name]
+        if end is None:
+            end = size
+        return self.mm[self.base + offset + start:self.base + offset + end]
+
+    def array(self, name):
+        """
+        Read a section of integers
+        """
+        values = array('l')
+        values.fromstring(self.section(name))
+        return values
+
+    def tweet_id(self, pos):
+        """
+        Get the ID of the schedule tweet at a position
+        """
+        sch_tweet_id = self.section('ids', self.id_offsets[pos],
+                                    self.id_offsets[pos + 1]).decode('utf-8')
+        self.positions[sch_tweet_id] = pos
+        return sch_tweet_id
+
+    def position(self, sch_tweet_id):
+        """
+        Get the position of a schedule tweet ID, or None
+        """
+        if sch_tweet_id not in self.positions and \
+                len(self.positions) < self.count:
+            for pos in xrange(self.count):
+                self.tweet_id(pos)
+        return self.positions.get(sch_tweet_id)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, sch_tweet_id):
+        return self.position(sch_tweet_id) is not None
+
+    def __iter__(self):
+        for pos in sorted(xrange(self.count), key=self.ranks.__getitem__):
+            yield self.tweet_id(pos)
+
+    def __getitem__(self, sch_tweet_id):
+        pos = self.position(sch_tweet_id)
+        if pos is None:
+            raise KeyError(sch_tweet_id)
+
+        text, entities = marshal.loads(self.section(
+            'records', self.record_offsets[pos], self.record_offsets[pos + 1]))
+
+        sch_entities = []
+        for tokens, mask, etype, etype_id in entities:
+            tokens = array('i', tokens)
+            sch_entities.append(ScheduleEntity(
+                tokens, mask, self.types[etype], etype_id, len(tokens)))
+
+        return ScheduleTweet(self.epochs[pos], text, tuple(sch_entities))
+
+    def window(self, epoch, time_tsl):
+        """
+        Return the IDs of the schedule tweets whose time distance from
+        epoch is lower than time_tsl, in the schedule Dict order
+        """
+        lo = bisect_right(self.epochs, epoch - time_tsl)
+        hi = bisect_left(self.epochs, epoch + time_tsl, lo)
+
+        return [self.tweet_id(pos) for pos in sorted(
+            xrange(lo, hi), key=self.ranks.__getitem__)]
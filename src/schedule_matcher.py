@@ -2,17 +2,70 @@
 # encoding: utf-8
 
 import io
+import os
+import sys
 import argparse
 import logging
 import string
+import heapq
+import json
+import multiprocessing
 import twitter_nlp.python.twokenize as twk
 
+from bisect import bisect_right
+from collections import namedtuple
+from itertools import groupby, izip
+from operator import itemgetter
 from backports import csv
-from dateutil.parser import parse
-from Levenshtein import jaro_winkler
 
+from batch_scoring import BatchEntityScorer
+from checkpoint import MatchCheckpoint
+from conll_eval import ConllEval
+from profiling import StageProfiler
+from schedule_index import (ScheduleTimeIndex, ScheduleEntity, ScheduleTweet,
+                            parse_epoch, format_epoch, index_key,
+                            compile_schedule, open_compiled_schedule)
+from streaming_join import sorted_summary_rows, sliding_window_join
+from summary_loader import load_summary, split_entities
+from token_similarity import (FuzzyTokenIndex, SimilarityCache,
+                              TokenVocabulary)
 from utils import import_config, set_log_config
 
+# Matcher shared with the worker processes, which inherit it when forked
+_matcher = None
+
+# Entity types IDs
+OTHER, CONTRIBUTOR, WORK = range(3)
+
+
+class UGCTweet(namedtuple('UGCTweet', ['created_at', 'text_utf8',
+                                       'entities_utf8'])):
+    """
+    User-generated tweet: creation date in epoch seconds, text and
+    entities annotated. The text and the entities (joined by tabs) are
+    stored encoded in UTF-8, which takes a fraction of the memory of
+    unicode strings, and decoded when accessed.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_unicode(cls, created_at, text, entities):
+        """
+        Create a tweet from its unicode text and entities
+        """
+        return cls(created_at, text.encode('utf-8'),
+                   u'\t'.join(entities).encode('utf-8'))
+
+    @property
+    def text(self):
+        return self.text_utf8.decode('utf-8')
+
+    @property
+    def entities(self):
+        if not self.entities_utf8:
+            return []
+        return self.entities_utf8.decode('utf-8').split(u'\t')
+
 
 class ScheduleMatcher(object):
     """
@@ -31,13 +84,73 @@ class ScheduleMatcher(object):
     -t time_tsl (int)
     -i ../path/to/UGC_INPUTFILE_summary.csv
     -s ../path/to/SCHEDULE_INPUTFILE_summary.csv
+    [--streaming-join]
+    [--sim-cache ../path/to/SIMILARITY_CACHE.pkl]
+    [--sweep -W work_grid -C contr_grid -T time_grid]
+    [--workers N]
+    [--evaluate] [--no-output]
+    [--schedule-index ../path/to/SCHEDULE_INDEX.idx [--compile-schedule]]
+    [--batch-scoring]
+    [--profile] [--profile-stats ../path/to/PROFILE.pstats]
+    [--top-k K]
+    [--checkpoint ../path/to/CHECKPOINT.pkl]
+
+    With --streaming-join the input files are sorted by date and joined
+    with a sliding window, instead of being loaded in memory. The tweets
+    are then written out in chronological order.
+
+    With --sim-cache the token similarity scores are loaded from and
+    saved to the given file, so that they are reused by the next runs.
+
+    With --sweep the grids of thresholds (comma-separated lists) are
+    evaluated in one pass, and the precision, recall and FB1 of each
+    combination are written in results/schedule_matcher_sweep.txt
+
+    With --workers the UG tweets are matched in chunks by a pool of
+    processes. The results are written out in the input order.
+
+    With --evaluate the results are evaluated while matching, as done by
+    conlleval, and the scores are written in
+    results/score.schedule_matcher_%s_%s_%s.txt. With --no-output the
+    results in CoNLL format are not written.
+
+    With --schedule-index the schedule is compiled once in a binary file,
+    which is mapped in memory by the next runs instead of importing the
+    schedule file again. The file is compiled again when the schedule
+    file, the stopwords file or the limit change. With --compile-schedule
+    the schedule is only compiled, without matching. The index is not
+    used in streaming join mode.
+
+    With --batch-scoring all the entities in the time window of a UG tweet
+    are scored at once with NumPy.
+
+    With --profile the time spent in each stage of the run and the
+    counters of the matching are written in
+    results/profile.schedule_matcher_%s_%s_%s.json. With --profile-stats
+    the matching loop is profiled with cProfile, and the stats are written
+    in the given file.
+
+    With --top-k only the K best schedule tweets matched are kept for
+    each UG tweet, ranked by the string similarity of their entities and
+    their time proximity. The ranking is written in JSON lines in
+    results/ranking.schedule_matcher_%s_%s_%s_topK.json
+
+    With --checkpoint the matching is incremental, for input files which
+    grow by appending rows: only the UG tweets appended since the previous
+    run, and the ones whose time window includes schedule tweets appended
+    since then, are matched. The results of the others are taken from the
+    checkpoint, which is then updated.
 
     """
     def __init__(self, input_file, schedule_file, limit, work_tsl,
-                 contr_tsl, time_tsl):
+                 contr_tsl, time_tsl, streaming_join=False, sim_cache=None,
+                 workers=1, evaluate=False, write_output=True,
+                 schedule_index=None, batch_scoring=False, profile=False,
+                 profile_stats=None, top_k=None, checkpoint=None):
         """
         """
         self.cfg_match = import_config('matcher')
+        self.profiler = StageProfiler(profile, profile_stats)
 
         self.input_file = input_file
         self.schedule_file = schedule_file
@@ -45,18 +158,80 @@ class ScheduleMatcher(object):
         self.work_tsl = work_tsl
         self.contr_tsl = contr_tsl
         self.time_tsl = time_tsl
+        self.streaming_join = streaming_join
+        self.workers = workers
+        self.write_output = write_output
+        self.schedule_index = schedule_index
+        self.top_k = top_k
 
-        self.DictTweets = self.import_ugc_tweets()
-        self.DictSched = self.import_schedule()
-        self.stopwords = self.import_stopwords()
+        # Stopwords are needed for normalizing the schedule entities
+        with self.profiler.stage('import_stopwords'):
+            self.stopwords = self.import_stopwords()
+        # Interned tokens of the schedule entities
+        self.vocab = TokenVocabulary()
 
-        # Initialize counters
+        # In streaming join mode the input files are read while matching
+        if streaming_join:
+            self.DictTweets = None
+            self.DictSched = {}
+        else:
+            with self.profiler.stage('import_ugc'):
+                self.DictTweets = (self.import_ugc_tweets() if input_file
+                                   else {})
+            with self.profiler.stage('import_schedule'):
+                self.DictSched, self.SchedIndex = self.load_schedule()
+
+        # Token similarity scores shared across the UG tweets
+        self.sim_cache = SimilarityCache(
+            self.cfg_match['similarity_cache_size'], sim_cache)
+        self.batch_scorer = None
+        if batch_scoring:
+            self.batch_scorer = BatchEntityScorer(
+                self.cfg_match['batch_scorer_cache_size'])
+
+        # Initialize counters of the tokens annotated and predicted as
+        # entities, without and with (_c_) checking the entity type
         (self.tp_count, self.fp_count, self.tn_count, self.fn_count,
          self.tp_c_count, self.fp_c_count, self.tn_c_count, self.fn_c_count
          ) = (0,)*8
 
-        self.outfile = "../results/schedule_matcher_%s_%s_%s.txt" % (
-                            work_tsl, contr_tsl, time_tsl)
+        run_name = "schedule_matcher_%s_%s_%s" % (work_tsl, contr_tsl,
+                                                  time_tsl)
+        if top_k:
+            run_name += "_top%d" % top_k
+        self.outfile = "../results/%s.txt" % run_name
+        self.sweep_outfile = "../results/schedule_matcher_sweep.txt"
+
+        # Evaluation of the results computed while matching
+        self.evaluation = ConllEval() if evaluate else None
+        self.score_outfile = "../results/score.%s.txt" % run_name
+        self.profile_outfile = "../results/profile.%s.json" % run_name
+
+        # Ranking of the schedule tweets matched, in top-k mode
+        self.ranking_outfile = "../results/ranking.%s.json" % run_name
+        self.ranking_outf = None
+
+        # Results of the previous runs, in incremental mode
+        self.checkpoint = None
+        if checkpoint:
+            self.checkpoint = MatchCheckpoint(checkpoint,
+                                              self.checkpoint_params())
+
+    def checkpoint_params(self):
+        """
+        Get the parameters of the run which the results in a checkpoint
+        depend on
+        """
+        stat = os.stat(self.cfg_match['stopwords'])
+        return {'input_file': os.path.abspath(self.input_file),
+                'schedule_file': os.path.abspath(self.schedule_file),
+                'limit': self.limit,
+                'work_tsl': self.work_tsl,
+                'contr_tsl': self.contr_tsl,
+                'time_tsl': self.time_tsl,
+                'top_k': self.top_k,
+                'top_k_time_weight': self.cfg_match['top_k_time_weight'],
+                'stopwords': [stat.st_size, repr(stat.st_mtime)]}
 
     def import_stopwords(self):
         """
@@ -77,116 +252,217 @@ class ScheduleMatcher(object):
     def import_ugc_tweets(self):
         """
         Import in a Dict the UGC tweets information, using as key
-        the tweet ID
+        the tweet ID. The tweets are stored as UGCTweet records. The file
+        is loaded in parallel by the workers.
         """
         logging.info('Importing User-Generated tweets...')
         DictTweets = {}
-        with io.open(self.input_file, newline='', encoding='utf-8') as infile:
-            _reader = csv.reader(infile)
-            next(_reader)
-            for row in _reader:
-                tweet_id, created_at, text = row[0:3]
-                DictTweets[tweet_id] = {}
-                DictTweets[tweet_id]['created_at'] = created_at
-                DictTweets[tweet_id]['text'] = text
-                DictTweets[tweet_id]['entities'] = []
-                if len(row) > 3:
-                    DictTweets[tweet_id]['entities'] = row[3:]
+        columns = load_summary(self.input_file, self.workers)
+        for tweet_id, epoch, text, entities in izip(*columns):
+            DictTweets[tweet_id] = UGCTweet(epoch, text, '\t'.join(entities))
 
         logging.info("Done!")
         return DictTweets
 
+    def ugc_tweet(self, row, epoch=None):
+        """
+        Get the UGC tweet ID and information from a summary file row. The
+        creation date is stored as epoch seconds, unless already parsed.
+        The tweet ID is encoded in UTF-8, as the text.
+        """
+        tweet_id, created_at, text = row[0:3]
+        if epoch is None:
+            epoch = self.parse_date(created_at)
+
+        return tweet_id.encode('utf-8'), UGCTweet.from_unicode(
+            epoch, text, row[3:])
+
     def import_schedule(self):
         """
         Import in a Dict the schedule tweets information, using as key
-        the tweet ID
+        the tweet ID. The file is loaded in parallel by the workers.
         """
         count = 0
         DictSched = {}
-        with io.open(self.schedule_file, newline='', encoding='utf-8') as inf:
-            _reader = csv.reader(inf)
-            next(_reader)
-            # Iterate over Schedule Tweets
-            for row in _reader:
-                sch_tweet_id, created_at, text = row[:3]
-                if len(row) > 3:
-                    entities = row[3:]
+        columns = load_summary(self.schedule_file, self.workers, self.limit,
+                               split=True)
+        # Iterate over Schedule Tweets
+        for sch_tweet_id, epoch, text, entities in izip(*columns):
+            if count == 0:
+                logging.info("Processing Schedule Tweets...")
+            elif count % 1000 == 0:
+                logging.info("Processed %d Schedule Tweets", count)
+            count += 1
 
-                if self.limit and count == self.limit:
-                    break
-                if count == 0:
-                    logging.info("Processing Schedule Tweets...")
-                elif count % 1000 == 0:
-                    logging.info("Processed %d Schedule Tweets", count)
-                count += 1
-
-                DictSched[sch_tweet_id] = {}
-                DictSched[sch_tweet_id]['text'] = text
-                DictSched[sch_tweet_id]['entities'] = (
-                    self.extract_schedule_entities(text, entities))
-                DictSched[sch_tweet_id]['created_at'] = parse(created_at)
+            text = text.decode('utf-8')
+            DictSched[sch_tweet_id.decode('utf-8')] = ScheduleTweet(
+                epoch, text, self.extract_schedule_entities(text, entities))
 
         logging.info("Done!")
         return DictSched
 
+    def load_schedule(self):
+        """
+        Load the schedule and its time index. With a schedule index file,
+        the compiled schedule is opened, or compiled if it is out of date.
+        """
+        if not self.schedule_index:
+            DictSched = self.import_schedule()
+            return DictSched, ScheduleTimeIndex(DictSched)
+
+        key = index_key(self.schedule_file, self.cfg_match['stopwords'],
+                        self.limit)
+        compiled = open_compiled_schedule(self.schedule_index, key)
+        if compiled is not None:
+            logging.info("Opened compiled schedule %s", self.schedule_index)
+            self.vocab = TokenVocabulary(compiled.vocab)
+            return compiled, compiled
+
+        DictSched = self.import_schedule()
+        logging.info("Compiling schedule in %s...", self.schedule_index)
+        compile_schedule(DictSched, self.vocab, self.schedule_index, key)
+        logging.info("Done!")
+        return DictSched, ScheduleTimeIndex(DictSched)
+
+    def schedule_tweet(self, row, epoch=None):
+        """
+        Get the schedule tweet ID and information from a summary file row.
+        The creation date is stored as epoch seconds, unless already parsed.
+        """
+        sch_tweet_id, created_at, text = row[:3]
+        if epoch is None:
+            epoch = self.parse_date(created_at)
+
+        return sch_tweet_id, ScheduleTweet(
+            epoch, text, self.extract_schedule_entities(
+                text, split_entities(row[3:])))
+
+    def token_ids(self, sch_tweet):
+        """
+        Return the token IDs of the entities of a schedule tweet
+        """
+        return [token_id for sch_entity in sch_tweet.entities
+                for token_id in sch_entity.tokens]
+
+    def parse_date(self, created_at):
+        """
+        Parse a creation date to epoch seconds
+        """
+        with self.profiler.stage('date_parsing'):
+            return parse_epoch(created_at)
+
     def extract_schedule_entities(self, text, entities):
         """
-        Extract the entities annotated from the text of the schedule tweet
+        Extract the entities annotated from the text of the schedule tweet,
+        given as (start, end, type) offsets, normalized for the matching
         """
         entities_token = set()
-        for entity in entities:
-            i, e, etype = entity.split(',')
-            token = text[int(i):int(e)]
-            entities_token.add((token, etype))
-        return entities_token
+        for i, e, etype in entities:
+            entities_token.add((text[i:e], etype))
+
+        sch_entities = []
+        for token, etype in entities_token:
+            entity_tokens = tuple(token.lower().split())
+            # Sanity check over schedule entities annotated
+            if not entity_tokens:
+                continue
+            sch_entities.append(ScheduleEntity(
+                self.vocab.encode(entity_tokens),
+                tuple(t not in self.stopwords and
+                      t not in string.punctuation for t in entity_tokens),
+                etype,
+                self.entity_type_id(etype),
+                len(entity_tokens)))
 
-    def search_schedule_matches(self, sch_tweet_id, tweet_text_tokens,
-                                entities_matched, entities_token_matched,
-                                matched_sch_ids):
+        return tuple(sch_entities)
+
+    def entity_type_id(self, etype):
+        """
+        Get the ID of an entity type
+        """
+        if etype.endswith('Contributor'):
+            return CONTRIBUTOR
+        elif etype.endswith('Work'):
+            return WORK
+        return OTHER
+
+    def search_schedule_matches(self, sch_tweet_ids, tweet_tokens_index,
+                                work_tsl, contr_tsl):
         """
         Search for matches betweet schedule tweets annotated entities and
-        ugc tweet. It returns the matches found.
+        ugc tweet, whose tokens are given in a FuzzyTokenIndex. It yields
+        the entities over the thresholds, as (schedule tweet ID, entity,
+        tokens matched, score). With batch scoring, all the entities are
+        scored at once.
         """
+        if self.batch_scorer is not None:
+            thresholds = [float('inf')]*3
+            thresholds[CONTRIBUTOR] = contr_tsl
+            thresholds[WORK] = work_tsl
+            entities, scores, matched = self.batch_scorer.score(
+                self.DictSched, sch_tweet_ids, tweet_tokens_index,
+                thresholds)
+            for n in matched.nonzero()[0].tolist():
+                sch_tweet_id, sch_entity = entities[n]
+                token_matches, _ = self.score_schedule_entity(
+                    sch_entity, tweet_tokens_index)
+                yield sch_tweet_id, sch_entity, token_matches, float(
+                    scores[n])
+            return
+
         # Iterate over the entities of the schedule
-        for sch_entity in self.DictSched[sch_tweet_id]['entities']:
-            sch_entity_strip = sch_entity[0].lower().split()
-            sch_entity_type = sch_entity[1]
-            # Sanity check over schedule entities annotated
-            if not sch_entity_strip:
-                continue
+        for sch_tweet_id in sch_tweet_ids:
+            for sch_entity in self.DictSched[sch_tweet_id].entities:
+                token_matches, score = self.score_schedule_entity(
+                    sch_entity, tweet_tokens_index)
 
-            # Get token matched between ugc and schedule tweet
-            token_matches = [
-                (t, sch_entity_type) for t in sch_entity_strip if [
-                    s for s in tweet_text_tokens
-                    if jaro_winkler(t.lower(), s.lower()) >= 0.95
-                    ] and
-                t not in self.stopwords and
-                t not in string.punctuation]
-
-            # Compute score for string similarity
-            score = len(token_matches)/float(len(sch_entity_strip))
-
-            # Check if string similarity conditions are valid
-            if (sch_entity_type.endswith('Contributor') and
-                    score >= self.contr_tsl) or \
-               (sch_entity_type.endswith('Work') and
-                    score >= self.work_tsl):
-                # Discard matches againts already matched entities
-                if sch_entity_strip not in entities_matched:
-                    entities_matched.append(sch_entity_strip)
-                    if token_matches not in entities_token_matched:
-                        entities_token_matched += token_matches
-                    matched_sch_ids.append(sch_tweet_id)
-
-        return entities_matched, entities_token_matched, matched_sch_ids
-
-    def convert_entity_iob(self, tweet_ent_split, iob, prev_type, token):
+                # Check if string similarity conditions are valid
+                if self.is_entity_matched(sch_entity.etype_id, score,
+                                          work_tsl, contr_tsl):
+                    yield sch_tweet_id, sch_entity, token_matches, score
+
+    def score_schedule_entity(self, sch_entity, tweet_tokens_index):
         """
-        Convert entity to IOB format
+        Compute the string similarity score between a schedule entity and
+        the ugc tweet. It returns the tokens matched and the score.
+        """
+        # Get token matched between ugc and schedule tweet
+        tokens = self.vocab.tokens
+        token_matches = [
+            (tokens[t], sch_entity.etype) for t, to_match in zip(
+                sch_entity.tokens, sch_entity.mask) if
+            to_match and tweet_tokens_index.has_match(t)]
+
+        # Compute score for string similarity
+        score = len(token_matches)/float(sch_entity.size)
+
+        return token_matches, score
+
+    def is_entity_matched(self, etype_id, score, work_tsl, contr_tsl):
+        """
+        Check if the string similarity score of an entity is over the
+        threshold of its type
         """
-        etype = [x[1] for x in tweet_ent_split if x[0] == token][0]
+        return (etype_id == CONTRIBUTOR and score >= contr_tsl) or \
+               (etype_id == WORK and score >= work_tsl)
 
+    def add_entity_match(self, sch_tweet_id, sch_entity_strip, token_matches,
+                         entities_matched, entities_token_matched,
+                         matched_sch_ids):
+        """
+        Add an entity matched to the matches found
+        """
+        # Discard matches againts already matched entities
+        if sch_entity_strip not in entities_matched:
+            entities_matched.append(sch_entity_strip)
+            if token_matches not in entities_token_matched:
+                entities_token_matched += token_matches
+            matched_sch_ids.append(sch_tweet_id)
+
+    def convert_entity_iob(self, etype, iob, prev_type):
+        """
+        Convert entity to IOB format
+        """
         if not iob and etype != 'O':
             iob = 'B'
             prev_type = etype
@@ -202,98 +478,783 @@ class ScheduleMatcher(object):
 
         return ann_entity, prev_type, iob
 
-    def write_results(self, outf, tweet_text_tokens, tweet_ent_split,
-                      entities_token_matched):
+    def entity_types(self, entities_token):
+        """
+        Map each entity token to its type. When a token appears more than
+        once, the type of its first occurrence is kept.
+        """
+        token_types = {}
+        for token, etype in entities_token:
+            if token not in token_types:
+                token_types[token] = etype
+        return token_types
+
+    def conll_lines(self, tweet_text_tokens, tweet_ent_split,
+                    entities_token_matched):
         """
-        Write out results in CoNLL format.
+        Yield the tokens of the tweet with the entities annotated and
+        predicted, in IOB format.
         """
         iob = None
         prev_type = None
         ann_iob = None
         ann_prev_type = None
 
+        ann_types = self.entity_types(tweet_ent_split)
+        pred_types = self.entity_types(entities_token_matched)
+
         # Get info about entities annotated
         for token in tweet_text_tokens:
-            if token in [x[0] for x in tweet_ent_split]:
+            if token in ann_types:
                 ann_entity, ann_prev_type, ann_iob = self.convert_entity_iob(
-                    tweet_ent_split, ann_iob, ann_prev_type, token)
+                    ann_types[token], ann_iob, ann_prev_type)
             else:
                 ann_entity = 'O'
 
             # Get info about entities predicted
-            if token in [x[0] for x in entities_token_matched]:
+            if token in pred_types:
                 pred_entity, prev_type, iob = self.convert_entity_iob(
-                    entities_token_matched, iob, prev_type, token)
+                    pred_types[token], iob, prev_type)
             else:
                 pred_entity = 'O'
 
-            outf.write(
-                unicode('%s %s %s\n' % (token, ann_entity, pred_entity)))
-        outf.write(unicode('\n'))
+            yield token, ann_entity, pred_entity
+
+    def write_results(self, outf, tweet_text_tokens, tweet_ent_split,
+                      entities_token_matched):
+        """
+        Write out results in CoNLL format. The lines of the tweet are
+        buffered and written at once. When evaluating, the results are
+        added to the evaluation, and outf can be None for not writing them.
+        """
+        with self.profiler.stage('writing'):
+            lines = []
+            for token, ann_entity, pred_entity in self.conll_lines(
+                    tweet_text_tokens, tweet_ent_split,
+                    entities_token_matched):
+                self.count_token(ann_entity, pred_entity)
+                if self.evaluation:
+                    self.evaluation.add(token, ann_entity, pred_entity)
+                lines.append(u'%s %s %s\n' % (token, ann_entity, pred_entity))
+            lines.append(u'\n')
+            if self.evaluation:
+                self.evaluation.add_boundary()
+
+            if outf is not None:
+                outf.write(u''.join(lines))
+
+    def count_token(self, ann_entity, pred_entity):
+        """
+        Update the counters with a token annotated and predicted
+        """
+        if ann_entity != 'O' and pred_entity != 'O':
+            self.tp_count += 1
+        elif pred_entity != 'O':
+            self.fp_count += 1
+        elif ann_entity != 'O':
+            self.fn_count += 1
+        else:
+            self.tn_count += 1
+
+        ann_type = ann_entity.split('-', 1)[-1]
+        pred_type = pred_entity.split('-', 1)[-1]
+        if ann_entity == pred_entity == 'O':
+            self.tn_c_count += 1
+        elif ann_type == pred_type:
+            self.tp_c_count += 1
+        else:
+            if pred_entity != 'O':
+                self.fp_c_count += 1
+            if ann_entity != 'O':
+                self.fn_c_count += 1
+
+    def counters(self):
+        """
+        Return the values of the counters
+        """
+        return (self.tp_count, self.fp_count, self.tn_count, self.fn_count,
+                self.tp_c_count, self.fp_c_count, self.tn_c_count,
+                self.fn_c_count)
+
+    def add_counters(self, counters):
+        """
+        Add to the counters the values counted elsewhere
+        """
+        (self.tp_count, self.fp_count, self.tn_count, self.fn_count,
+         self.tp_c_count, self.fp_c_count, self.tn_c_count, self.fn_c_count
+         ) = [x + y for x, y in zip(self.counters(), counters)]
+
+    def log_counters(self):
+        """
+        Log the counters of the tokens matched
+        """
+        logging.info("Entity tokens: tp %d, fp %d, tn %d, fn %d",
+                     *self.counters()[:4])
+        logging.info("Entity tokens by type: tp %d, fp %d, tn %d, fn %d",
+                     *self.counters()[4:])
+
+    def tokenize_tweet(self, tweet):
+        """
+        Tokenize the text of an UG tweet, and split the text of the
+        entities annotated. It returns the tokens and the list of
+        (entity token, entity type).
+        """
+        text = tweet.text
+        tweet_text_tokens = twk.tokenize(text.lower())
+
+        # Get UG Tweet Entities text splitted
+        tweet_ent_split = []
+        for tweet_entity in tweet.entities:
+            s, e, t = tweet_entity.split(',')
+            s, e = int(s), int(e)
+            tweet_ent_split += [(x, t) for x in text[s:e].lower().split()]
+
+        return tweet_text_tokens, tweet_ent_split
+
+    def match_tweet(self, outf, tweet_id, tweet, sch_tweet_ids):
+        """
+        Search for matches between an UG tweet and the schedule tweets in
+        its time window, and write out the results.
+        """
+        (tweet_text_tokens, tweet_ent_split, entities_token_matched, _,
+            ranking) = self.find_matches(tweet, sch_tweet_ids)
+
+        self.write_results(outf, tweet_text_tokens, tweet_ent_split,
+                           entities_token_matched)
+        if self.ranking_outf is not None:
+            self.write_ranking(self.ranking_outf, tweet_id, ranking)
+
+    def find_matches(self, tweet, sch_tweet_ids):
+        """
+        Search for matches between an UG tweet and the schedule tweets in
+        its time window. It returns the tweet tokens, the entities
+        annotated, the entities tokens matched, the IDs of the schedule
+        tweets matched and, in top-k mode, their ranking (otherwise None).
+        """
+        with self.profiler.stage('tokenization'):
+            tweet_text_tokens, tweet_ent_split = self.tokenize_tweet(tweet)
+
+        with self.profiler.stage('similarity'):
+            # Index the tweet tokens for the fuzzy matching against the
+            # schedule entities tokens
+            tweet_tokens_index = FuzzyTokenIndex(tweet_text_tokens,
+                                                 cache=self.sim_cache,
+                                                 vocab=self.vocab)
+
+            # Iterate over the Schedule Tracks whose time distance from
+            # the ug tweet is lower than the threshold, looking for the
+            # best match
+            entities_matched = []
+            entities_token_matched = []
+            matched_sch_ids = []
+            ranking = None
+            matches = self.search_schedule_matches(sch_tweet_ids,
+                                                   tweet_tokens_index,
+                                                   self.work_tsl,
+                                                   self.contr_tsl)
+            if self.top_k:
+                ranking = self.rank_matches(tweet, matches)
+                entities_token_matched, matched_sch_ids = (
+                    self.ranked_entity_matches(ranking))
+            else:
+                for sch_tweet_id, sch_entity, token_matches, _ in matches:
+                    self.profiler.count('entities_matched')
+                    self.add_entity_match(sch_tweet_id, sch_entity.tokens,
+                                          token_matches, entities_matched,
+                                          entities_token_matched,
+                                          matched_sch_ids)
+
+        self.profiler.count('windows_scanned')
+        self.profiler.count('schedule_tweets_scanned', len(sch_tweet_ids))
+        self.profiler.count('candidate_pairs',
+                            tweet_tokens_index.candidate_pairs)
+        if entities_token_matched:
+            self.profiler.count('tweets_matched')
+
+        # Check matches in debug mode
+        if entities_token_matched:
+            logging.debug("New match found!")
+            logging.debug("Tokens matched: <%s>", ', '.join(
+                            [x[0] for x in entities_token_matched]))
+            for m in set(matched_sch_ids):
+                logging.debug("Track matched (%s): '%s'",
+                              format_epoch(self.DictSched[m].created_at),
+                              self.DictSched[m].text)
+
+            logging.debug("Original tweet (%s):, '%s'",
+                          format_epoch(tweet.created_at), tweet.text)
+
+            logging.debug("Tweet Entities annotated: <%s> ", ', '.join(
+                [x[0] for x in tweet_ent_split]))
+
+        return (tweet_text_tokens, tweet_ent_split, entities_token_matched,
+                matched_sch_ids, ranking)
+
+    def rank_matches(self, tweet, matches, time_tsl=None):
+        """
+        Rank the schedule tweets whose entities are over the thresholds,
+        keeping the top_k in a bounded heap. A schedule tweet is ranked by
+        the sum of the string similarity scores of its entities matched,
+        plus its time proximity to the UG tweet (1 at the same time, 0 at
+        time_tsl, by default the one of the matcher) weighted by
+        top_k_time_weight. It returns the ranking, best first, as (rank
+        score, string score, time distance, schedule tweet ID, [(entity,
+        tokens matched, score)]).
+        """
+        if time_tsl is None:
+            time_tsl = self.time_tsl
+        time_weight = self.cfg_match['top_k_time_weight']
+        heap = []
+        # The matches of a schedule tweet are consecutive
+        for n, (sch_tweet_id, sch_matches) in enumerate(
+                groupby(matches, key=itemgetter(0))):
+            entities = [x[1:] for x in sch_matches]
+            string_score = sum(x[2] for x in entities)
+            diff = abs(self.DictSched[sch_tweet_id].created_at -
+                       tweet.created_at)
+            rank_score = string_score + time_weight*(
+                1.0 - diff/float(time_tsl))
+
+            # On ties, the first schedule tweet in the window is kept
+            item = (rank_score, -n, string_score, diff, sch_tweet_id,
+                    entities)
+            if len(heap) < self.top_k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+            self.profiler.count('entities_matched', len(entities))
+
+        return [x[:1] + x[2:] for x in sorted(heap, reverse=True)]
+
+    def ranked_entity_matches(self, ranking):
+        """
+        Get the entities tokens matched and the IDs of the schedule tweets
+        matched from a ranking, discarding the entities already matched by
+        a better ranked schedule tweet
+        """
+        entities_matched = set()
+        tokens_matched = set()
+        entities_token_matched = []
+        matched_sch_ids = []
+        for _, _, _, sch_tweet_id, entities in ranking:
+            for sch_entity, token_matches, _ in entities:
+                entity_key = tuple(sch_entity.tokens)
+                if entity_key in entities_matched:
+                    continue
+                entities_matched.add(entity_key)
+                matched_sch_ids.append(sch_tweet_id)
+                for token_match in token_matches:
+                    if token_match not in tokens_matched:
+                        tokens_matched.add(token_match)
+                        entities_token_matched.append(token_match)
+
+        return entities_token_matched, matched_sch_ids
+
+    def write_ranking(self, outf, tweet_id, ranking):
+        """
+        Write out the ranking of the schedule tweets matched with an UG
+        tweet, in a JSON line
+        """
+        tokens = self.vocab.tokens
+        result = {'id': tweet_id, 'ranking': [
+            {'rank': n + 1,
+             'schedule_id': sch_tweet_id,
+             'score': round(rank_score, 6),
+             'string_score': round(string_score, 6),
+             'time_distance': diff,
+             'entities': [
+                 {'text': u' '.join(tokens[t] for t in sch_entity.tokens),
+                  'type': sch_entity.etype,
+                  'score': round(score, 6),
+                  'tokens_matched': [x[0] for x in token_matches]}
+                 for sch_entity, token_matches, score in entities]}
+            for n, (rank_score, string_score, diff, sch_tweet_id,
+                    entities) in enumerate(ranking)]}
+        outf.write(unicode(json.dumps(result, sort_keys=True)) + u'\n')
+
+    def schedule_windows(self, time_tsl=None, tweet_ids=None):
+        """
+        Yield each UG tweet together with the IDs of the schedule tweets
+        in its time window, looked up in the schedule index. By default
+        the window is given by the time_tsl of the matcher, and all the
+        UG tweets are yielded.
+        """
+        if time_tsl is None:
+            time_tsl = self.time_tsl
+        if tweet_ids is None:
+            tweet_ids = self.DictTweets
+
+        for tweet_id in tweet_ids:
+            tweet = self.DictTweets[tweet_id]
+            with self.profiler.stage('window'):
+                sch_tweet_ids = self.SchedIndex.window(tweet.created_at,
+                                                       time_tsl)
+            yield tweet_id, tweet, sch_tweet_ids
+
+    def streaming_windows(self):
+        """
+        Yield each UG tweet together with the IDs of the schedule tweets
+        in its time window, joining the two input files sorted by date.
+        Only the schedule tweets in the current window are kept in
+        DictSched, and only their tokens in the vocabulary.
+        """
+        ugc_rows = sorted_summary_rows(self.input_file, self.parse_date)
+        sched_rows = (
+            (epoch, self.window_schedule_tweet(row, epoch)) for epoch, row in
+            sorted_summary_rows(self.schedule_file, self.parse_date,
+                                self.limit))
+
+        windows = sliding_window_join(ugc_rows, sched_rows, self.time_tsl,
+                                      self.evict_schedule_tweet)
+        while True:
+            # The window stage includes reading and sorting the input files
+            with self.profiler.stage('window'):
+                window_row = next(windows, None)
+                if window_row is None:
+                    break
+                epoch, row, window = window_row
+                self.DictSched = dict(x[1] for x in window)
+                tweet_id, tweet = self.ugc_tweet(row, epoch)
+            yield tweet_id, tweet, [x[1][0] for x in window]
+
+    def window_schedule_tweet(self, row, epoch):
+        """
+        Get a schedule tweet entering the time window of the streaming
+        join, whose tokens are referenced until it is evicted
+        """
+        sch_tweet_id, sch_tweet = self.schedule_tweet(row, epoch)
+        self.vocab.retain(self.token_ids(sch_tweet))
+        return sch_tweet_id, sch_tweet
+
+    def evict_schedule_tweet(self, sched_row):
+        """
+        Free the tokens of a schedule tweet evicted from the time window of
+        the streaming join, and its arrays in the batch scorer
+        """
+        _, (sch_tweet_id, sch_tweet) = sched_row
+        freed = self.vocab.release(self.token_ids(sch_tweet))
+        if self.batch_scorer is not None:
+            self.batch_scorer.discard(sch_tweet_id)
+
+        # Once the similarity cache is full, the pairs of the tokens freed
+        # are removed, so that it keeps caching the pairs of the window
+        if freed and len(self.sim_cache) >= self.sim_cache.max_size:
+            self.sim_cache.prune(lambda x: x in self.vocab.ids)
 
     def run(self):
         """
         Iterate over the UG tweets looking for matches with
         the schedule.
         """
-        with io.open(self.outfile, 'w+', newline='', encoding='utf-8') as outf:
+        if self.streaming_join and self.workers > 1:
+            logging.warning("Workers not supported in streaming join mode, "
+                            "using a single process")
+        if self.streaming_join and self.schedule_index:
+            logging.warning("Schedule index not supported in streaming join "
+                            "mode, reading the schedule file")
+        if self.checkpoint is not None:
+            if self.streaming_join:
+                logging.warning("Incremental matching not supported in "
+                                "streaming join mode, matching all the "
+                                "tweets")
+                self.checkpoint = None
+            elif self.workers > 1:
+                logging.warning("Workers not supported in incremental "
+                                "mode, using a single process")
+
+        outf = None
+        if self.write_output:
+            outf = io.open(self.outfile, 'w+', newline='', encoding='utf-8')
+        if self.top_k:
+            self.ranking_outf = io.open(self.ranking_outfile, 'w+',
+                                        encoding='utf-8')
+
+        try:
             logging.info("Looking for matches...")
-            for tweet_id in self.DictTweets:
-                tweet_date = parse(self.DictTweets[tweet_id]['created_at'])
-                tweet_text_tokens = twk.tokenize(
-                    self.DictTweets[tweet_id]['text'].lower())
-
-                # Get UG Tweet Entities text splitted
-                tweet_ent_split = []
-                for tweet_entity in self.DictTweets[tweet_id]['entities']:
-                    s, e, t = tweet_entity.split(',')
-                    s, e = int(s), int(e)
-                    tweet_ent_split += [
-                        (x, t) for x in
-                        self.DictTweets[tweet_id]['text'][s:e].lower().split()]
-
-                # Iterate over Schedule Tracks looking for the best match
-                entities_matched = []
-                entities_token_matched = []
-                matched_sch_ids = []
-                for sch_tweet_id in self.DictSched:
-                    sch_date = self.DictSched[sch_tweet_id]['created_at']
-                    diff = (sch_date - tweet_date).total_seconds()
-
-                    # If the time distance between schedule and ug tweet
-                    # is lower than the threshold, search for matches
-                    if abs(diff) < self.time_tsl:
-                        (entities_matched, entities_token_matched,
-                            matched_sch_ids) = self.search_schedule_matches(
-                                        sch_tweet_id,
-                                        tweet_text_tokens,
-                                        entities_matched,
-                                        entities_token_matched,
-                                        matched_sch_ids)
-
-                # Check matches in debug mode
-                if entities_token_matched:
-                    logging.debug("New match found!")
-                    logging.debug("Tokens matched: <%s>", ', '.join(
-                                    [x[0] for x in entities_token_matched]))
-                    for m in set(matched_sch_ids):
-                        logging.debug("Track matched (%s): '%s'",
-                                      self.DictSched[m]['created_at'].strftime(
-                                            '%Y-%m-%d %H:%M:%S'),
-                                      self.DictSched[m]['text'])
-
-                    logging.debug("Original tweet (%s):, '%s'",
-                                  parse(self.DictTweets[tweet_id]['created_at']
-                                        ).strftime('%Y-%m-%d %H:%M:%S'),
-                                  self.DictTweets[tweet_id]['text'])
-
-                    logging.debug("Tweet Entities annotated: <%s> ", ', '.join(
-                        [x[0] for x in tweet_ent_split]))
-
-                self.write_results(outf, tweet_text_tokens, tweet_ent_split,
-                                   entities_token_matched)
+            self.profiler.start_hot_loop()
+            with self.profiler.stage('matching'):
+                if self.checkpoint is not None:
+                    self.run_incremental(outf)
+                elif self.workers > 1 and not self.streaming_join:
+                    self.run_workers(outf)
+                else:
+                    if self.streaming_join:
+                        tweets = self.streaming_windows()
+                    else:
+                        tweets = self.schedule_windows()
+
+                    for tweet_id, tweet, sch_tweet_ids in tweets:
+                        self.match_tweet(outf, tweet_id, tweet,
+                                         sch_tweet_ids)
+        finally:
+            self.profiler.stop_hot_loop()
+            if outf is not None:
+                outf.close()
+            if self.ranking_outf is not None:
+                self.ranking_outf.close()
+                self.ranking_outf = None
+                logging.info("Ranking written in %s", self.ranking_outfile)
 
         logging.info("Done!")
+        self.log_counters()
+        if self.evaluation:
+            self.write_evaluation()
+        self.sim_cache.log_stats()
+        if self.sim_cache.path:
+            self.sim_cache.save()
+        if self.profiler.enabled:
+            self.write_profile()
+
+    def run_incremental(self, outf):
+        """
+        Match the UG tweets appended since the checkpoint, and the ones
+        whose time window includes schedule tweets appended since then,
+        taking the results of the others from the checkpoint. All the
+        results are written out in the usual order, and the checkpoint is
+        updated with them.
+        """
+        checkpoint = self.checkpoint
+        checkpoint.load()
+        if checkpoint.last_epoch is not None:
+            logging.info("Checkpoint of the UG tweets up to %s",
+                         format_epoch(checkpoint.last_epoch))
+
+        new_tweet_ids = checkpoint.appended_ids('ugc', self.input_file)
+        new_sch_tweet_ids = checkpoint.appended_ids('schedule',
+                                                    self.schedule_file)
+        if new_tweet_ids is None or new_sch_tweet_ids is None:
+            # All the rows of an input file are new
+            tweet_ids = list(self.DictTweets)
+        else:
+            new_tweet_ids = set(new_tweet_ids)
+            new_epochs = sorted(
+                self.DictSched[x].created_at for x in
+                (y.decode('utf-8') for y in new_sch_tweet_ids)
+                if x in self.DictSched)
+
+            tweet_ids = [
+                tweet_id for tweet_id in self.DictTweets if
+                tweet_id in new_tweet_ids or
+                tweet_id not in checkpoint.results or
+                self.in_time_window(new_epochs,
+                                    self.DictTweets[tweet_id].created_at)]
+        logging.info("Matching %d UG tweets, taking %d from the checkpoint",
+                     len(tweet_ids), len(self.DictTweets) - len(tweet_ids))
+
+        results = {}
+        ranking_outf = self.ranking_outf
+        try:
+            for tweet_id, tweet, sch_tweet_ids in self.schedule_windows(
+                    tweet_ids=tweet_ids):
+                tweet_outf = io.StringIO()
+                if self.top_k:
+                    self.ranking_outf = io.StringIO()
+                self.match_tweet(tweet_outf, tweet_id, tweet, sch_tweet_ids)
+                results[tweet_id] = (
+                    tweet_outf.getvalue(),
+                    self.ranking_outf.getvalue() if self.top_k else None)
+        finally:
+            self.ranking_outf = ranking_outf
+
+        for tweet_id in self.DictTweets:
+            if tweet_id not in results:
+                results[tweet_id] = checkpoint.results[tweet_id]
+                self.add_checkpoint_results(results[tweet_id][0])
+            lines, ranking = results[tweet_id]
+            if outf is not None:
+                outf.write(lines)
+            if self.ranking_outf is not None:
+                self.ranking_outf.write(ranking)
+
+        checkpoint.results = results
+        if self.DictTweets:
+            checkpoint.last_epoch = max(
+                x.created_at for x in self.DictTweets.itervalues())
+        checkpoint.save()
+
+    def in_time_window(self, epochs, epoch):
+        """
+        Check if any of the sorted epochs is in the time window of epoch
+        """
+        n = bisect_right(epochs, epoch - self.time_tsl)
+        return n < len(epochs) and epochs[n] < epoch + self.time_tsl
+
+    def add_checkpoint_results(self, lines):
+        """
+        Add to the counters and to the evaluation the results of an UG
+        tweet taken from the checkpoint, in CoNLL format
+        """
+        self.profiler.count('tweets_from_checkpoint')
+        for line in lines.split(u'\n'):
+            if line:
+                token, ann_entity, pred_entity = line.rsplit(u' ', 2)
+                self.count_token(ann_entity, pred_entity)
+                if self.evaluation:
+                    self.evaluation.add(token, ann_entity, pred_entity)
+        if self.evaluation:
+            self.evaluation.add_boundary()
+
+    def run_workers(self, outf):
+        """
+        Match the UG tweets in chunks with a pool of processes. The
+        workers are forked after the schedule is loaded, so they share
+        it. The results of the chunks are written out in the input order
+        and their counters added up. With a similarity cache file, the
+        pairs cached by the workers are merged into the cache, to be saved.
+        """
+        global _matcher
+        _matcher = self
+        self.sim_cache.track_added(bool(self.sim_cache.path))
+
+        chunk_size = self.cfg_match['workers_chunk_size']
+        tweet_ids = list(self.DictTweets)
+        chunks = [tweet_ids[i:i + chunk_size]
+                  for i in range(0, len(tweet_ids), chunk_size)]
+
+        logging.info("Matching %d chunks with %d workers",
+                     len(chunks), self.workers)
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            for (results, counters, evaluation, cache_stats, profile,
+                    ranking) in pool.imap(match_tweets_chunk, chunks):
+                if outf is not None:
+                    outf.write(results)
+                if self.ranking_outf is not None:
+                    self.ranking_outf.write(ranking)
+                if evaluation:
+                    self.evaluation.update(evaluation)
+                self.add_counters(counters)
+                self.sim_cache.hits += cache_stats[0]
+                self.sim_cache.misses += cache_stats[1]
+                if cache_stats[2]:
+                    self.sim_cache.update(cache_stats[2])
+                self.profiler.update(profile)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _matcher = None
+            self.sim_cache.track_added(False)
+
+    def match_chunk(self, tweet_ids):
+        """
+        Match a chunk of UG tweets. It returns the results in CoNLL
+        format, and the counters, evaluation, cache statistics (hits,
+        misses and pairs added, if tracked), profile and ranking of the
+        chunk.
+        """
+        counters = self.counters()
+        hits, misses = self.sim_cache.hits, self.sim_cache.misses
+        if self.evaluation:
+            self.evaluation = ConllEval()
+        self.profiler = StageProfiler(self.profiler.enabled)
+
+        outf = io.StringIO() if self.write_output else None
+        if self.top_k:
+            self.ranking_outf = io.StringIO()
+        for tweet_id, tweet, sch_tweet_ids in self.schedule_windows(
+                tweet_ids=tweet_ids):
+            self.match_tweet(outf, tweet_id, tweet, sch_tweet_ids)
+
+        return (outf.getvalue() if outf is not None else None,
+                [x - y for x, y in zip(self.counters(), counters)],
+                self.evaluation,
+                (self.sim_cache.hits - hits, self.sim_cache.misses - misses,
+                 self.sim_cache.pop_added()),
+                self.profiler.stats(),
+                self.ranking_outf.getvalue() if self.top_k else None)
+
+    def write_profile(self):
+        """
+        Write the time spent in each stage and the counters of the run
+        """
+        self.profiler.count('cache_hits', self.sim_cache.hits)
+        self.profiler.count('jaro_winkler_calls', self.sim_cache.misses)
+        self.profiler.dump(self.profile_outfile,
+                           work_tsl=self.work_tsl,
+                           contr_tsl=self.contr_tsl,
+                           time_tsl=self.time_tsl,
+                           workers=self.workers,
+                           streaming_join=self.streaming_join,
+                           batch_scoring=self.batch_scorer is not None,
+                           top_k=self.top_k)
+
+    def write_evaluation(self):
+        """
+        Log the evaluation of the results, and write it in the same format
+        of conlleval
+        """
+        self.evaluation.finish()
+        report = self.evaluation.report()
+        for line in report.splitlines():
+            logging.info(line)
+
+        with io.open(self.score_outfile, 'w+', newline='',
+                     encoding='utf-8') as outf:
+            outf.write(unicode(report))
+        logging.info("Evaluation written in %s", self.score_outfile)
+
+    def sweep(self, work_grid, contr_grid, time_grid):
+        """
+        Evaluate all the combinations of the thresholds in the grids. The
+        string similarity scores and time distances of the schedule
+        entities are computed once with the widest thresholds, then each
+        combination is evaluated from these scores. It writes a table
+        with precision, recall and FB1 of each combination. With batch
+        scoring, the entities are scored with NumPy as when matching, and
+        in top-k mode only the top_k schedule tweets matched with each
+        combination are kept, as when matching with its thresholds.
+        """
+        if self.workers > 1:
+            logging.warning("Workers not supported in sweep mode, using a "
+                            "single process")
+        if self.checkpoint is not None:
+            logging.warning("Incremental matching not supported in sweep "
+                            "mode, scoring all the tweets")
+        if self.evaluation:
+            logging.warning("Evaluation skipped in sweep mode, the scores "
+                            "of each combination are written in %s",
+                            self.sweep_outfile)
+        if self.profiler.enabled:
+            logging.warning("Profiling not supported in sweep mode")
+
+        min_work_tsl = min(work_grid)
+        min_contr_tsl = min(contr_grid)
+        max_time_tsl = max(time_grid)
+
+        logging.info("Scoring entities with the widest thresholds...")
+        tweets_scores = []
+        for tweet_id, tweet, sch_tweet_ids in self.schedule_windows(
+                max_time_tsl):
+            tweet_text_tokens, tweet_ent_split = self.tokenize_tweet(tweet)
+            tweet_tokens_index = FuzzyTokenIndex(tweet_text_tokens,
+                                                 cache=self.sim_cache,
+                                                 vocab=self.vocab)
+
+            # Entities over the widest thresholds, with their time distance
+            entities_scores = []
+            diffs = {}
+            for sch_tweet_id, sch_entity, token_matches, score in \
+                    self.search_schedule_matches(sch_tweet_ids,
+                                                 tweet_tokens_index,
+                                                 min_work_tsl, min_contr_tsl):
+                if sch_tweet_id not in diffs:
+                    diffs[sch_tweet_id] = abs(
+                        self.DictSched[sch_tweet_id].created_at -
+                        tweet.created_at)
+                entities_scores.append((diffs[sch_tweet_id], sch_tweet_id,
+                                        sch_entity, token_matches, score))
+
+            tweets_scores.append(
+                (tweet, tweet_text_tokens, tweet_ent_split, entities_scores))
+
+        logging.info("Evaluating %d threshold combinations...",
+                     len(work_grid)*len(contr_grid)*len(time_grid))
+        results = []
+        for work_tsl in work_grid:
+            for contr_tsl in contr_grid:
+                for time_tsl in time_grid:
+                    evaluation = self.evaluate_thresholds(
+                        tweets_scores, work_tsl, contr_tsl, time_tsl)
+                    results.append(
+                        (work_tsl, contr_tsl, time_tsl, evaluation))
+
+        self.write_sweep(results)
+        logging.info("Done!")
+        self.sim_cache.log_stats()
+        if self.sim_cache.path:
+            self.sim_cache.save()
+
+    def evaluate_thresholds(self, tweets_scores, work_tsl, contr_tsl,
+                            time_tsl):
+        """
+        Evaluate the matches of a thresholds combination from the scores
+        computed by the sweep. In top-k mode the schedule tweets matched
+        are ranked with the time_tsl of the combination.
+        """
+        evaluation = ConllEval()
+        for (tweet, tweet_text_tokens, tweet_ent_split,
+                entities_scores) in tweets_scores:
+            entities_matched = []
+            entities_token_matched = []
+            matched_sch_ids = []
+            matches = [
+                (sch_tweet_id, sch_entity, token_matches, score) for
+                (diff, sch_tweet_id, sch_entity, token_matches, score) in
+                entities_scores if diff < time_tsl and self.is_entity_matched(
+                    sch_entity.etype_id, score, work_tsl, contr_tsl)]
+            if self.top_k:
+                entities_token_matched, _ = self.ranked_entity_matches(
+                    self.rank_matches(tweet, matches, time_tsl))
+            else:
+                for sch_tweet_id, sch_entity, token_matches, _ in matches:
+                    self.add_entity_match(sch_tweet_id, sch_entity.tokens,
+                                          token_matches, entities_matched,
+                                          entities_token_matched,
+                                          matched_sch_ids)
+
+            for token, ann_entity, pred_entity in self.conll_lines(
+                    tweet_text_tokens, tweet_ent_split,
+                    entities_token_matched):
+                evaluation.add(token, ann_entity, pred_entity)
+            evaluation.add_boundary()
+
+        evaluation.finish()
+        return evaluation
+
+    def write_sweep(self, results):
+        """
+        Write out the evaluation of each thresholds combination
+        """
+        etypes = sorted(set(etype for result in results
+                            for etype in result[3].by_type()))
+        header = ['work_tsl', 'contr_tsl', 'time_tsl',
+                  'precision', 'recall', 'FB1'] + [
+                    '%s_FB1' % etype for etype in etypes]
+
+        best = None
+        with io.open(self.sweep_outfile, 'w+', newline='',
+                     encoding='utf-8') as outf:
+            outf.write(unicode('\t'.join(header) + '\n'))
+            for work_tsl, contr_tsl, time_tsl, evaluation in results:
+                precision, recall, fb1 = evaluation.overall()
+                by_type = evaluation.by_type()
+                row = [work_tsl, contr_tsl, time_tsl] + [
+                    '%.2f' % x for x in (precision, recall, fb1)] + [
+                    '%.2f' % by_type[etype][2] if etype in by_type else
+                    '0.00' for etype in etypes]
+                outf.write(unicode('\t'.join(str(x) for x in row) + '\n'))
+
+                if not best or fb1 > best[3]:
+                    best = (work_tsl, contr_tsl, time_tsl, fb1)
+
+        logging.info("Sweep results written in %s", self.sweep_outfile)
+        if best:
+            logging.info("Best FB1 %.2f with work_tsl %s, contr_tsl %s, "
+                         "time_tsl %s", best[3], best[0], best[1], best[2])
+
+
+def match_tweets_chunk(tweet_ids):
+    """
+    Match a chunk of UG tweets in a worker process
+    """
+    return _matcher.match_chunk(tweet_ids)
+
+
+def parse_grid(value):
+    """
+    Parse a comma-separated list of string similarity thresholds
+    """
+    return [float(x) for x in value.split(',')]
+
+
+def parse_time_grid(value):
+    """
+    Parse a comma-separated list of time-distance thresholds
+    """
+    return [int(x) for x in value.split(',')]
 
 
 def arg_parser():
@@ -313,6 +1274,57 @@ def arg_parser():
                         help="Contributor threshold for matching")
     parser.add_argument("-t", "--time-tsl", type=int, dest='time_tsl',
                         help="Time-distance threshold for matching")
+    parser.add_argument("--streaming-join", action='store_true',
+                        dest='streaming_join',
+                        help="Join the input files sorted by date with a "
+                             "sliding window instead of loading them")
+    parser.add_argument("--sim-cache", type=str, dest='sim_cache',
+                        help="File where to persist the token similarity "
+                             "cache between runs")
+    parser.add_argument("--sweep", action='store_true',
+                        help="Evaluate all the combinations of the "
+                             "thresholds grids")
+    parser.add_argument("-W", "--work-grid", type=parse_grid,
+                        dest='work_grid',
+                        help="Comma-separated Work thresholds for the sweep")
+    parser.add_argument("-C", "--contr-grid", type=parse_grid,
+                        dest='contr_grid',
+                        help="Comma-separated Contributor thresholds for the "
+                             "sweep")
+    parser.add_argument("-T", "--time-grid", type=parse_time_grid,
+                        dest='time_grid',
+                        help="Comma-separated Time-distance thresholds for "
+                             "the sweep")
+    parser.add_argument("-j", "--workers", type=int, dest='workers',
+                        default=1,
+                        help="Number of processes matching the UG tweets")
+    parser.add_argument("--evaluate", action='store_true',
+                        help="Evaluate the results while matching")
+    parser.add_argument("--no-output", action='store_false',
+                        dest='write_output',
+                        help="Do not write the results in CoNLL format")
+    parser.add_argument("--schedule-index", type=str, dest='schedule_index',
+                        help="Compiled schedule file, compiled if missing "
+                             "or out of date")
+    parser.add_argument("--compile-schedule", action='store_true',
+                        dest='compile_schedule',
+                        help="Only compile the schedule index")
+    parser.add_argument("-k", "--top-k", type=int, dest='top_k',
+                        help="Keep only the K best schedule tweets matched "
+                             "for each UG tweet, and write their ranking")
+    parser.add_argument("--batch-scoring", action='store_true',
+                        dest='batch_scoring',
+                        help="Score the entities of each time window at "
+                             "once with NumPy")
+    parser.add_argument("--profile", action='store_true',
+                        help="Write the time spent in each stage and the "
+                             "counters of the run")
+    parser.add_argument("--profile-stats", type=str, dest='profile_stats',
+                        help="File where to write the cProfile stats of the "
+                             "matching loop")
+    parser.add_argument("--checkpoint", type=str,
+                        help="Checkpoint file of the incremental matching, "
+                             "updated at the end of the run")
 
     args = parser.parse_args()
 
@@ -323,10 +1335,39 @@ if __name__ == '__main__':
 
     args = arg_parser()
     set_log_config(args.logfile, logging.INFO)
-    sm = ScheduleMatcher(args.input_file,
+    if args.compile_schedule and not args.schedule_index:
+        logging.error("Please insert the option --schedule-index")
+        sys.exit()
+    if args.compile_schedule and args.streaming_join:
+        logging.error("The schedule is not compiled in streaming join mode, "
+                      "please remove the option --streaming-join")
+        sys.exit()
+    if args.sweep and args.streaming_join:
+        logging.error("Sweep mode not supported in streaming join mode, "
+                      "please remove the option --streaming-join")
+        sys.exit()
+
+    # The UG tweets are not needed when only compiling the schedule
+    sm = ScheduleMatcher(None if args.compile_schedule else args.input_file,
                          args.sched_file,
                          args.limit,
                          args.work_tsl,
                          args.contr_tsl,
-                         args.time_tsl)
-    sm.run()
+                         args.time_tsl,
+                         args.streaming_join,
+                         args.sim_cache,
+                         args.workers,
+                         args.evaluate,
+                         args.write_output,
+                         args.schedule_index,
+                         args.batch_scoring,
+                         args.profile,
+                         args.profile_stats,
+                         args.top_k,
+                         args.checkpoint)
+    if args.sweep:
+        sm.sweep(args.work_grid or [args.work_tsl],
+                 args.contr_grid or [args.contr_tsl],
+                 args.time_grid or [args.time_tsl])
+    elif not args.compile_schedule:
+        sm.run()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import io
+import os
+import heapq
+import shutil
+import logging
+import tempfile
+
+from collections import deque
+from backports import csv
+
+# Maximum number of sorted runs merged at once, bounding the files open
+MAX_MERGE_RUNS = 64
+
+
+def sorted_summary_rows(infile, parse_date, limit=None, run_size=100000):
+    """
+    Read a summary file and yield its rows as (epoch, row) sorted by the
+    creation date, parsed with parse_date to integer epoch seconds. The
+    file is sorted once with an external merge sort: sorted runs of
+    run_size rows are spilled to temporary files and then merged, so the
+    memory needed is bounded by run_size. The runs are merged in passes
+    of at most MAX_MERGE_RUNS runs, so that no more files are open at
+    once.
+    """
+    rundir = tempfile.mkdtemp(prefix='sorted_runs')
+    try:
+        runs = []
+        rows = []
+        count = 0
+        with io.open(infile, newline='', encoding='utf-8') as inf:
+            _reader = csv.reader(inf)
+            next(_reader)
+            for row in _reader:
+                if limit and count == limit:
+                    break
+                count += 1
+
+                rows.append((parse_date(row[1]), count, row))
+                if len(rows) == run_size:
+                    runs.append(spill_run(rows, rundir))
+                    rows = []
+
+        rows.sort()
+        if not runs:
+            for epoch, _, row in rows:
+                yield epoch, row
+            return
+
+        # The rows in memory are merged last, with at most
+        # MAX_MERGE_RUNS - 1 runs
+        while len(runs) >= MAX_MERGE_RUNS:
+            logging.info("Merging %d sorted runs of %s in groups of %d",
+                         len(runs), infile, MAX_MERGE_RUNS)
+            runs = [write_run(heapq.merge(*[read_run(path) for path in
+                                            runs[i:i + MAX_MERGE_RUNS]]),
+                              rundir)
+                    for i in range(0, len(runs), MAX_MERGE_RUNS)]
+
+        logging.info("Merging %d sorted runs of %s", len(runs) + 1, infile)
+        for epoch, _, row in heapq.merge(*([read_run(path) for path in runs]
+                                           + [iter(rows)])):
+            yield epoch, row
+    finally:
+        shutil.rmtree(rundir, ignore_errors=True)
+
+
+def spill_run(rows, rundir):
+    """
+    Sort the rows and write them in a temporary file of the directory
+    rundir, returning its path
+    """
+    rows.sort()
+    return write_run(rows, rundir)
+
+
+def write_run(rows, rundir):
+    """
+    Write rows already sorted, in (epoch, count, row) format, in a new
+    file of the directory rundir, and return its path
+    """
+    fd, path = tempfile.mkstemp(suffix='.csv', dir=rundir)
+    with io.open(fd, 'w', newline='', encoding='utf-8') as runfile:
+        _writer = csv.writer(runfile, quoting=csv.QUOTE_ALL)
+        for epoch, count, row in rows:
+            _writer.writerow([repr(epoch), unicode(count)] + row)
+
+    return path
+
+
+def read_run(path):
+    """
+    Read back a sorted run written by write_run. The file is opened only
+    when the first row is read, and removed once read.
+    """
+    try:
+        with io.open(path, newline='', encoding='utf-8') as runfile:
+            for row in csv.reader(runfile):
+                yield int(row[0]), int(row[1]), row[2:]
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def sliding_window_join(ugc_rows, sched_rows, time_tsl, evicted=None):
+    """
+    Walk two streams of (epoch, row) sorted by epoch with two pointers.
+    For each user-generated tweet it yields (epoch, row, window), where
+    window is the deque of (epoch, row) schedule tweets whose time
+    distance from the tweet is lower than time_tsl. Schedule tweets are
+    added to the window as the time advances and evicted once they are
+    too old, so only the window is kept in memory. The function evicted,
+    if given, is called with each (epoch, row) evicted.
+    """
+    window = deque()
+    sched_rows = iter(sched_rows)
+    next_sched = next(sched_rows, None)
+
+    for epoch, row in ugc_rows:
+        # Add the schedule tweets not too far in the future
+        while next_sched is not None and next_sched[0] < epoch + time_tsl:
+            window.append(next_sched)
+            next_sched = next(sched_rows, None)
+
+        # Evict the schedule tweets too far in the past
+        while window and window[0][0] <= epoch - time_tsl:
+            sched_row = window.popleft()
+            if evicted is not None:
+                evicted(sched_row)
+
+        yield epoch, row, window
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import csv
+import logging
+import multiprocessing
+
+from array import array
+from collections import namedtuple
+from itertools import imap, izip
+
+from schedule_index import parse_epoch
+
+# Number of chunks parsed by each worker, for balancing the load
+CHUNKS_PER_WORKER = 4
+# Minimum size in bytes of a chunk
+MIN_CHUNK_SIZE = 1 << 20
+# Size of the blocks read when counting the quotes
+BLOCK_SIZE = 1 << 20
+
+# Columns of a summary file: tweet IDs and texts encoded in UTF-8, creation
+# dates in epoch seconds and entities annotated of each tweet
+SummaryColumns = namedtuple('SummaryColumns', ['ids', 'epochs', 'texts',
+                                               'entities'])
+
+
+def split_entities(entities):
+    """
+    Split the entities annotated ('start,end,type') in tuples of (start,
+    end, type) offsets
+    """
+    split = []
+    for entity in entities:
+        i, e, etype = entity.split(',')
+        split.append((int(i), int(e), etype))
+
+    return tuple(split)
+
+
+def record_boundaries(path, offsets):
+    """
+    Return, for each of the sorted byte offsets of a CSV file, the offset
+    of the first record starting after it. A newline ends a record only
+    outside quoted fields, i.e. after an even number of quotes from the
+    start of the file, since the quotes inside the fields are doubled.
+    """
+    boundaries = []
+    quotes = 0
+    pos = 0
+    with open(path, 'rb') as inf:
+        for offset in offsets:
+            # Count the quotes up to the offset
+            while pos < offset:
+                block = inf.read(min(BLOCK_SIZE, offset - pos))
+                if not block:
+                    break
+                quotes += block.count(b'"')
+                pos += len(block)
+
+            # Look for the next newline outside quoted fields
+            while True:
+                line = inf.readline()
+                if not line:
+                    break
+                quotes += line.count(b'"')
+                pos += len(line)
+                if not quotes % 2:
+                    break
+            boundaries.append(pos)
+
+    return boundaries
+
+
+def summary_chunks(path, n_chunks):
+    """
+    Split a summary file in up to n_chunks byte ranges of whole records,
+    after the header
+    """
+    size = os.path.getsize(path)
+    n_chunks = max(1, min(n_chunks, size // MIN_CHUNK_SIZE))
+    boundaries = record_boundaries(
+        path, [0] + [size*n // n_chunks for n in range(1, n_chunks)])
+    boundaries.append(size)
+
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:])
+            if start < end]
+
+
+def chunk_lines(inf, start, end):
+    """
+    Yield the lines of a file in a byte range
+    """
+    inf.seek(start)
+    pos = start
+    while pos < end:
+        line = inf.readline()
+        if not line:
+            break
+        pos += len(line)
+        yield line
+
+
+def parse_chunk(args):
+    """
+    Parse the records of a summary file in a byte range, up to limit
+    records. The fields are parsed as UTF-8 bytes by the csv module,
+    which is much faster than backports.csv. It returns the columns of the
+    chunk, parsing the dates and splitting the entities if requested.
+    """
+    path, start, end, limit, parse_dates, split = args
+    ids, texts, entities = [], [], []
+    epochs = array('l')
+    with open(path, 'rb') as inf:
+        for row in csv.reader(chunk_lines(inf, start, end)):
+            if limit and len(ids) == limit:
+                break
+            if not row:
+                continue
+
+            ids.append(row[0])
+            if parse_dates:
+                epochs.append(parse_epoch(row[1]))
+            texts.append(row[2])
+            if split:
+                entities.append(split_entities(
+                    [x.decode('utf-8') for x in row[3:]]))
+            else:
+                entities.append(tuple(row[3:]))
+
+    return SummaryColumns(ids, epochs, texts, entities)
+
+
+def load_summary(path, workers=1, limit=None, parse_dates=True,
+                 split=False):
+    """
+    Load the records of a summary file in columns: tweet IDs and texts
+    encoded in UTF-8, creation dates in epoch seconds (if parse_dates) and
+    entities annotated of each tweet, as UTF-8 'start,end,type' strings or
+    split in (start, end, type) tuples (if split). With workers > 1 the
+    file is split in chunks of whole records, parsed by a pool of
+    processes. With a limit, only the first records are loaded.
+    """
+    chunks = summary_chunks(path, 1 if limit else workers*CHUNKS_PER_WORKER)
+    tasks = [(path, start, end, limit, parse_dates, split)
+             for start, end in chunks]
+    pool = None
+    if workers > 1 and len(tasks) > 1:
+        logging.info("Loading %s in %d chunks with %d workers", path,
+                     len(tasks), workers)
+        pool = multiprocessing.Pool(workers)
+        parts = pool.imap(parse_chunk, tasks)
+    else:
+        parts = imap(parse_chunk, tasks)
+
+    # The chunks are added in order as soon as they are parsed
+    columns = SummaryColumns([], array('l'), [], [])
+    try:
+        for part in parts:
+            for column, values in izip(columns, part):
+                column.extend(values)
+        if pool is not None:
+            pool.close()
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.join()
+
+    return columns
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import logging
+import cPickle
+
+from array import array
+from Levenshtein import jaro_winkler
+
+# Jaro-Winkler similarity needed by two tokens for being matched
+JW_CUTOFF = 0.95
+# Winkler prefix scaling factor, as used by Levenshtein.jaro_winkler
+PREFIX_WEIGHT = 0.1
+# Common prefix length for which Levenshtein.jaro_winkler is always 1.0
+MAX_PREFIX = 10
+
+# Tolerance for the floating point comparisons of the upper bounds
+EPSILON = 1e-9
+
+
+def min_common_prefix(len1, len2, cutoff=JW_CUTOFF):
+    """
+    Return the minimum common prefix length that two strings of length
+    len1 and len2 need for reaching a Jaro-Winkler similarity of cutoff,
+    or None if they can never reach it.
+
+    The Jaro similarity is (m/len1 + m/len2 + 1 - t/2m)/3, where the
+    matching characters m are at most the length of the shorter string.
+    With a common prefix of length p, Jaro-Winkler is j + (1 - j)*p*0.1,
+    capped at 1.0, which grows with j. Using the upper bound of j gives
+    an upper bound of the similarity for each prefix length.
+    """
+    shorter, longer = sorted((len1, len2))
+    if not shorter:
+        return 0 if not longer else None
+
+    jaro_max = (2.0 + shorter / float(longer)) / 3.0
+    for prefix in range(min(shorter, MAX_PREFIX) + 1):
+        if jaro_max + (1.0 - jaro_max)*prefix*PREFIX_WEIGHT >= \
+                cutoff - EPSILON:
+            return prefix
+
+    return None
+
+
+class TokenVocabulary(object):
+    """
+    Interning table of the normalized tokens, shared by the whole matcher.
+    Each token is mapped to a small integer ID, so that the entities are
+    stored as arrays of IDs and the exact matches are checked on integers.
+
+    For a schedule window which changes over time, the tokens can be
+    reference-counted: a token is freed when its last reference is
+    released, and its ID is reused by the next new token.
+    """
+    def __init__(self, tokens=()):
+        """
+        """
+        self.tokens = list(tokens)
+        self.ids = dict((token, n) for n, token in enumerate(self.tokens))
+        # References of each token ID, and IDs of the tokens freed
+        self.refs = {}
+        self.free = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def intern(self, token):
+        """
+        Return the ID of a token, adding it to the vocabulary if needed
+        """
+        token_id = self.ids.get(token)
+        if token_id is None:
+            if self.free:
+                token_id = self.free.pop()
+                self.tokens[token_id] = token
+            else:
+                token_id = len(self.tokens)
+                self.tokens.append(token)
+            self.ids[token] = token_id
+        return token_id
+
+    def retain(self, token_ids):
+        """
+        Add a reference to each of the token IDs
+        """
+        for token_id in token_ids:
+            self.refs[token_id] = self.refs.get(token_id, 0) + 1
+
+    def release(self, token_ids):
+        """
+        Remove a reference to each of the token IDs, freeing the tokens
+        left without references. It returns the tokens freed.
+        """
+        freed = []
+        for token_id in token_ids:
+            refs = self.refs.get(token_id, 0) - 1
+            if refs > 0:
+                self.refs[token_id] = refs
+                continue
+
+            self.refs.pop(token_id, None)
+            token = self.tokens[token_id]
+            if token is not None:
+                del self.ids[token]
+                self.tokens[token_id] = None
+                self.free.append(token_id)
+                freed.append(token)
+
+        return freed
+
+    def encode(self, tokens):
+        """
+        Return the array of the IDs of the tokens
+        """
+        return array('i', [self.intern(token) for token in tokens])
+
+    def get(self, token):
+        """
+        Return the ID of a token, or None if it is not in the vocabulary
+        """
+        return self.ids.get(token)
+
+
+class SimilarityCache(object):
+    """
+    Size-capped cache of the Jaro-Winkler similarity of (schedule token,
+    ugc token) pairs, shared across the whole matching run. Once max_size
+    pairs are stored, the new pairs are scored without being cached. The
+    scores do not depend on the thresholds, so the cache can be saved and
+    loaded back for the next runs. The pairs added can be tracked, so
+    that the ones added by the worker processes are merged back into the
+    cache of the parent.
+    """
+    def __init__(self, max_size, path=None):
+        """
+        """
+        self.max_size = max_size
+        self.path = path
+        self.scores = {}
+        self.hits = 0
+        self.misses = 0
+        # Pairs added since the last pop_added, when tracked
+        self.added = None
+
+        if path and os.path.isfile(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.scores)
+
+    def score(self, sch_token, ugc_token):
+        """
+        Return the Jaro-Winkler similarity of the tokens
+        """
+        key = (sch_token, ugc_token)
+        score = self.scores.get(key)
+        if score is not None:
+            self.hits += 1
+            return score
+
+        self.misses += 1
+        score = jaro_winkler(sch_token, ugc_token)
+        if len(self.scores) < self.max_size:
+            self.scores[key] = score
+            if self.added is not None:
+                self.added[key] = score
+        return score
+
+    def track_added(self, enabled=True):
+        """
+        Start or stop tracking the pairs added to the cache
+        """
+        self.added = {} if enabled else None
+
+    def pop_added(self):
+        """
+        Return the pairs added since the last call, if tracked, and reset
+        them
+        """
+        added = self.added
+        if added is not None:
+            self.added = {}
+        return added
+
+    def update(self, scores):
+        """
+        Add the pairs scored elsewhere (e.g. by a worker process), up to
+        max_size pairs
+        """
+        for key, score in scores.iteritems():
+            if len(self.scores) == self.max_size:
+                break
+            self.scores[key] = score
+
+    def prune(self, keep):
+        """
+        Remove the pairs whose schedule token is not to be kept
+        """
+        self.scores = dict(
+            (key, score) for key, score in self.scores.iteritems()
+            if keep(key[0]))
+
+    def load(self):
+        """
+        Load the scores saved by a previous run
+        """
+        logging.info('Loading similarity cache %s...', self.path)
+        with open(self.path, 'rb') as inf:
+            scores = cPickle.load(inf)
+        for key in scores:
+            if len(self.scores) == self.max_size:
+                break
+            self.scores[key] = scores[key]
+        logging.info("Loaded %d token pairs", len(self.scores))
+
+    def save(self):
+        """
+        Save the scores for the next runs
+        """
+        logging.info('Saving similarity cache %s...', self.path)
+        with open(self.path, 'wb') as outf:
+            cPickle.dump(self.scores, outf, cPickle.HIGHEST_PROTOCOL)
+        logging.info("Done!")
+
+    def log_stats(self):
+        """
+        Log the cache hits and misses
+        """
+        lookups = self.hits + self.misses
+        logging.info("Similarity cache: %d hits, %d misses (%.1f%% hit rate)"
+                     ", %d token pairs cached", self.hits, self.misses,
+                     100.0*self.hits/lookups if lookups else 0.0, len(self))
+
+
+class FuzzyTokenIndex(object):
+    """
+    Candidate generation index for Jaro-Winkler token matching. The
+    tokens are grouped by length and by prefix, so that a query only
+    scores exactly the tokens whose length and common prefix can reach
+    the cutoff, skipping all the pairs that provably cannot. With a
+    TokenVocabulary, the queries are token IDs.
+    """
+    def __init__(self, tokens, cutoff=JW_CUTOFF, cache=None, vocab=None):
+        """
+        """
+        self.cutoff = cutoff
+        if cache is not None:
+            self.similarity = cache.score
+        else:
+            self.similarity = jaro_winkler
+        self.tokens = set(t.lower() for t in tokens)
+
+        # IDs of the tokens, for the exact matches of the queries. Tokens
+        # out of the vocabulary cannot be matched exactly.
+        self.vocab = vocab
+        if vocab is not None:
+            self.token_ids = set(vocab.get(t) for t in self.tokens)
+            self.token_ids.discard(None)
+
+        # Index of the tokens by length, and by prefix of each length
+        self.buckets = {}
+        for token in self.tokens:
+            prefixes = self.buckets.setdefault(len(token), {})
+            for p in range(min(len(token), MAX_PREFIX) + 1):
+                prefixes.setdefault(token[:p], []).append(token)
+
+        self.prefix_len = {}
+        self.matched = {}
+        # Number of candidate pairs scored
+        self.candidate_pairs = 0
+
+    def candidates(self, query):
+        """
+        Yield the indexed tokens which could be similar to the query
+        """
+        for length, prefixes in self.buckets.iteritems():
+            key = (len(query), length)
+            if key not in self.prefix_len:
+                self.prefix_len[key] = min_common_prefix(
+                    len(query), length, self.cutoff)
+            p = self.prefix_len[key]
+            if p is None:
+                continue
+
+            for token in prefixes.get(query[:p], ()):
+                self.candidate_pairs += 1
+                yield token
+
+    def has_match(self, query):
+        """
+        Check if any indexed token has a Jaro-Winkler similarity with the
+        query greater or equal than the cutoff. The query is expected to be
+        already lowercased, or a token ID. The outcome is memoized, and
+        the exact matches do not compute any similarity.
+        """
+        matched = self.matched.get(query)
+        if matched is None:
+            if self.vocab is not None:
+                exact = query in self.token_ids
+                token = self.vocab.tokens[query]
+            else:
+                exact = query in self.tokens
+                token = query
+            matched = self.matched[query] = exact or any(
+                self.similarity(token, candidate) >= self.cutoff
+                for candidate in self.candidates(token))
+
+        return matched